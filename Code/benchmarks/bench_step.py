@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""Micro-benchmark of a single simulation step.
+
+Reports the time per step and the temporary memory allocated in each step by
+the reference implementation (run_ppi) and by the step kernel of PPIModel,
+using the national data. The temporary memory is measured with tracemalloc 
+(which also traces the buffers of numpy arrays) as the peak memory used during
+a step beyond the memory held before it, in the same way for both engines
+(run_ppi is measured step by step through its profiling hook), and the median
+over the steps is reported.
+
+PPIModel handles the national network as a dense matrix (it has fewer than
+ppi.DENSE_SIZE indicators), so its steps do not allocate arrays. What remains
+(about 1.5 KB per step, whatever the number of replicas) are the iterators of 
+numpy's operations and the views of the random numbers. With a sparse network
+(sparse=True), the product of the network and the changes of the indicators 
+is still allocated in each step, since scipy has no 'out' argument for sparse
+products.
+
+Usage
+-----
+    python bench_step.py [n_replicas ...]
+
+"""
+
+from __future__ import division, print_function
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from ppi import run_ppi, PPIModel
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'National_data')
+
+
+def load_national():
+    """Loads the national inputs of the model."""
+    import pandas as pd
+    data = pd.read_csv(os.path.join(DATA, 'final_sample_normalized.csv'), sep='\t', 
+                       encoding='utf-16', low_memory=False)
+    series = data[[str(year) for year in range(2006, 2017)]].values
+    from ppi import get_targets
+    I0, T = get_targets(series)
+    R = data['instrumental'].values
+    A = np.loadtxt(os.path.join(DATA, 'network.csv'))
+    alphas = np.loadtxt(os.path.join(DATA, 'alphas.csv'))
+    phi, tau = np.loadtxt(os.path.join(DATA, 'governance_params.csv'))
+    return dict(I0=I0, T=T, A=A, R=R, alpha=alphas, phi=phi, tau=tau)
+
+
+class StepMemory(object):
+    """A profile for run_ppi (see PhaseProfile) that records the temporary
+    memory of each step: the peak memory traced during the step beyond the
+    memory held before it."""
+    
+    def __init__(self):
+        self.peaks = []
+    
+    def start(self):
+        tracemalloc.start()
+        self.base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    
+    def lap(self, phase, step=False):
+        if step:
+            self.peaks.append(tracemalloc.get_traced_memory()[1]-self.base)
+            self.base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+    
+    def stop(self):
+        tracemalloc.stop()
+
+
+def bench_reference(inputs, runs=50):
+    """Time and temporary memory per step of run_ppi."""
+    np.random.seed(0)
+    steps = 0
+    start = time.perf_counter()
+    for run in range(runs):
+        ticks = run_ppi(outputs='ticks', **inputs)
+        steps += ticks.max()-1
+    elapsed = (time.perf_counter()-start)/steps
+    
+    memory = StepMemory()
+    run_ppi(outputs='ticks', profile=memory, **inputs)
+    return elapsed, np.median(memory.peaks)
+
+
+def bench_model(inputs, n_replicas, steps=20, repeats=20):
+    """Time and temporary memory per step of PPIModel.step."""
+    np.random.seed(0)
+    model = PPIModel(**inputs)
+    elapsed = 0
+    for repeat in range(repeats):
+        state = model.init_state(n_replicas, seed=repeat)
+        model.step(state) # warm up
+        start = time.perf_counter()
+        for step in range(steps):
+            model.step(state)
+        elapsed += time.perf_counter()-start
+    elapsed /= steps*repeats
+    
+    state = model.init_state(n_replicas, seed=0)
+    model.step(state)
+    tracemalloc.start()
+    peaks = []
+    for step in range(steps):
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        model.step(state)
+        peaks.append(tracemalloc.get_traced_memory()[1]-base)
+    tracemalloc.stop()
+    return elapsed, np.median(peaks)
+
+
+if __name__ == '__main__':
+    
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1, 100, 1000]
+    inputs = load_national()
+    
+    elapsed, peak = bench_reference(inputs)
+    print('%-22s %12s %16s' % ('engine', 'us/step', 'temp. KB/step'))
+    print('%-22s %12.1f %16.1f' % ('run_ppi', elapsed*1e6, peak/1024))
+    for K in sizes:
+        elapsed, peak = bench_model(inputs, K)
+        print('%-22s %12.1f %16.1f' % ('PPIModel.step K=%i' % K, elapsed*1e6, peak/1024))
+        print('%-22s %12.2f' % ('  per replica', elapsed*1e6/K))
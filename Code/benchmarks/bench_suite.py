@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""Benchmark suite of the simulation engine, the calibration and the data loading.
+
+Each case runs in its own process, so its peak resident memory (peak RSS, from
+resource.getrusage) is not affected by the other cases. For each case, the suite
+reports the simulations (or files) per second, the latency of a simulation step
+and the peak RSS. The cases are:
+
+    national: run_ppi on the national data (N=141).
+    state: run_ppi on the data of a state (Jalisco, N=96).
+    synthetic_<N>_<density>: run_ppi on random sparse networks of N=1,000 and
+    N=10,000 indicators with different densities (only the convergence times
+    are recorded, since the time series of 10,000 indicators are large).
+    run_model_100 and run_model_1000: calibration.run_model on the national
+    data with 100 and 1,000 simulations.
+    estimate: one iteration of calibration.estimate on the national data.
+    load_csv and load_csv_cached: data.load_table and data.load_matrix on the
+    national indicators and network, parsing the text files and from their
+    binary caches.
+
+The results can be saved as a baseline (a JSON file with the results and the
+machine where they were obtained) and later runs can be compared against it.
+Baselines are only comparable on the same machine.
+
+Usage
+-----
+    python bench_suite.py [case ...] [--save] [--compare] [--baseline PATH] [--threshold X]
+
+    Without cases, all of them are run (a case can also be given by a prefix,
+    e.g. 'synthetic'). --save stores the results in the baseline file (by default,
+    baselines.json next to this script) and --compare compares them with it; the
+    script exits with an error if a case is slower than its baseline by more than
+    the threshold (by default, 20%).
+
+"""
+
+from __future__ import division, print_function
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import shutil
+import subprocess
+import tempfile
+from collections import OrderedDict
+import numpy as np
+
+FOLDER = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(FOLDER, '..'))
+import ppi
+import calibration
+from data import load_table, load_matrix
+from bench_step import load_national, DATA
+
+SUBNATIONAL = os.path.join(FOLDER, '..', '..', 'Subnational_data')
+BASELINE = os.path.join(FOLDER, 'baselines.json')
+
+
+
+class SimulationCounter(object):
+    """Counts the simulations and steps performed by the calls to run_ppi of
+    a module (e.g. calibration), so the cases that call run_ppi indirectly can
+    also report their throughput."""
+
+    def __init__(self, module):
+        self.module = module
+        self.simulations = 0
+        self.steps = 0
+
+    def __enter__(self):
+        self.run_ppi = self.module.run_ppi
+        def run_ppi(*args, **kwargs):
+            outputs = self.run_ppi(*args, **kwargs)
+            ticks = outputs if kwargs.get('outputs', 'all') == 'ticks' else outputs[-2]
+            self.simulations += 1
+            self.steps += int(ticks.max())-1
+            return outputs
+        self.module.run_ppi = run_ppi
+        return self
+
+    def __exit__(self, *args):
+        self.module.run_ppi = self.run_ppi
+
+
+
+def simulate(inputs, runs, outputs='all'):
+    """Performs several seeded simulations with run_ppi."""
+    steps = 0
+    start = time.perf_counter()
+    for run in range(runs):
+        result = ppi.run_ppi(outputs=outputs, seed=run, **inputs)
+        ticks = result if outputs == 'ticks' else result[-2]
+        steps += int(ticks.max())-1
+    return dict(count=runs, unit='sims', steps=steps, seconds=time.perf_counter()-start)
+
+
+def case_national():
+    return simulate(load_national(), 50)
+
+
+def case_state(state='JAL'):
+    from subnational import load_state
+    data = load_state(SUBNATIONAL, state)
+    phi, tau = np.loadtxt(os.path.join(DATA, 'governance_params.csv'))
+    alphas = np.loadtxt(os.path.join(SUBNATIONAL, 'alphas', state+'.csv'))
+    inputs = dict(I0=data['I0'], T=data['T'], A=data['A'], R=data['R'], alpha=alphas, phi=phi, tau=tau)
+    return simulate(inputs, 50)
+
+
+def case_synthetic(N, density, runs):
+    import scipy.sparse as sp
+    rng = np.random.default_rng(0)
+    I0 = rng.uniform(0, .5, N)
+    edges = int(density*N*N) # drawn directly, since scipy.sparse.random may allocate N*N indices
+    A = sp.csr_matrix((rng.random(edges)*.5, (rng.integers(N, size=edges), rng.integers(N, size=edges))),
+                      shape=(N, N))
+    inputs = dict(I0=I0, T=I0+rng.uniform(.1, .5, N), R=rng.random(N)<.6, alpha=.1, A=A)
+    return simulate(inputs, runs, outputs='ticks')
+
+
+def case_run_model(sample_size):
+    inputs = load_national()
+    with SimulationCounter(calibration) as counter:
+        start = time.perf_counter()
+        calibration.run_model(inputs['I0'], inputs['T'], inputs['A'], inputs['R'], inputs['phi'],
+                              inputs['tau'], inputs['alpha'], sample_size, seed=0)
+        seconds = time.perf_counter()-start
+    return dict(count=counter.simulations, unit='sims', steps=counter.steps, seconds=seconds)
+
+
+def case_estimate():
+    inputs = load_national()
+    with SimulationCounter(calibration) as counter:
+        start = time.perf_counter()
+        calibration.estimate(inputs['I0'], inputs['T'], inputs['A'], inputs['R'], inputs['phi'],
+                             inputs['tau'], 35, alphas=inputs['alpha'], dev_lim=5, sample_size=10,
+                             parallel_processes=1, backend='serial', seed=0, max_iterations=1)
+        seconds = time.perf_counter()-start
+    return dict(count=counter.simulations, unit='sims', steps=counter.steps, seconds=seconds)
+
+
+def case_load_csv(cached, runs=20):
+    cache_dir = tempfile.mkdtemp()
+    paths = [os.path.join(DATA, 'final_sample_normalized.csv'), os.path.join(DATA, 'network.csv')]
+    if cached:
+        load_table(paths[0], cache_dir=cache_dir)
+        load_matrix(paths[1], cache_dir=cache_dir)
+    start = time.perf_counter()
+    for run in range(runs):
+        load_table(paths[0], cache=cached, cache_dir=cache_dir)
+        load_matrix(paths[1], cache=cached, cache_dir=cache_dir)
+    seconds = time.perf_counter()-start
+    shutil.rmtree(cache_dir)
+    return dict(count=2*runs, unit='files', steps=0, seconds=seconds)
+
+
+CASES = OrderedDict([
+    ('national', (case_national, ())),
+    ('state', (case_state, ())),
+    ('synthetic_1k_0.001', (case_synthetic, (1000, .001, 10))),
+    ('synthetic_1k_0.01', (case_synthetic, (1000, .01, 10))),
+    ('synthetic_1k_0.1', (case_synthetic, (1000, .1, 10))),
+    ('synthetic_10k_0.001', (case_synthetic, (10000, .001, 3))),
+    ('synthetic_10k_0.01', (case_synthetic, (10000, .01, 3))),
+    ('run_model_100', (case_run_model, (100,))),
+    ('run_model_1000', (case_run_model, (1000,))),
+    ('estimate', (case_estimate, ())),
+    ('load_csv', (case_load_csv, (False,))),
+    ('load_csv_cached', (case_load_csv, (True,))),
+])
+
+
+
+def peak_rss():
+    """Returns the peak resident memory of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak/2**20 if sys.platform == 'darwin' else peak/2**10 # bytes in macOS, KB in Linux
+
+
+def run_child(name):
+    """Runs a case in this process and prints its results as JSON."""
+    function, args = CASES[name]
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w') # silence the messages of the calibration
+    try:
+        result = function(*args)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    result.update(rate=result['count']/result['seconds'], peak_rss=peak_rss(),
+                  step_us=1e6*result['seconds']/result['steps'] if result['steps'] else None)
+    print(json.dumps(result))
+
+
+def run_case(name):
+    """Runs a case in a new process and returns its results."""
+    output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--child', name])
+    return json.loads(output.decode().strip().split('\n')[-1])
+
+
+def machine():
+    """Returns a description of the machine and of the libraries."""
+    return dict(node=platform.node(), processor=platform.processor() or platform.machine(),
+                cpus=os.cpu_count(), python=platform.python_version(), numpy=np.__version__)
+
+
+def report(results, baseline=None, threshold=.2):
+    """Prints the results (and their comparison with a baseline). Returns the
+    cases that are slower than their baseline by more than the threshold."""
+    header = '%-22s%14s%12s%12s' % ('case', 'rate', 'us/step', 'RSS MB')
+    if baseline is not None:
+        header += '%12s' % 'vs base'
+    print(header)
+    slower = []
+    for name, result in results.items():
+        line = '%-22s%14s%12s%12.1f' % (name, '%.1f %s/s' % (result['rate'], result['unit']),
+                                        '-' if result['step_us'] is None else '%.1f' % result['step_us'],
+                                        result['peak_rss'])
+        if baseline is not None and name in baseline:
+            ratio = baseline[name]['rate']/result['rate'] # time relative to the baseline
+            line += '%11.2fx' % ratio
+            if ratio > 1+threshold:
+                line += '  SLOWER'
+                slower.append(name)
+        print(line)
+    return slower
+
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmark suite of PPI.')
+    parser.add_argument('cases', nargs='*', help='cases (or prefixes of cases) to run')
+    parser.add_argument('--save', action='store_true', help='save the results in the baseline file')
+    parser.add_argument('--compare', action='store_true', help='compare the results with the baseline')
+    parser.add_argument('--baseline', default=BASELINE, help='path of the baseline file')
+    parser.add_argument('--threshold', type=float, default=.2, help='tolerated slowdown (fraction)')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        run_child(args.child)
+        sys.exit()
+
+    names = [name for name in CASES if not args.cases or any(name.startswith(case) for case in args.cases)]
+    if not names:
+        parser.error('unknown cases; the cases are: '+', '.join(CASES))
+
+    stored = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            stored = json.load(file)
+    baseline = None
+    if args.compare:
+        if stored is None:
+            parser.error('there is no baseline in '+args.baseline)
+        if stored['machine'] != machine():
+            print('Warning: the baseline was obtained in another machine:', stored['machine'])
+        baseline = stored['cases']
+
+    results = OrderedDict((name, run_case(name)) for name in names)
+    slower = report(results, baseline, args.threshold)
+
+    if args.save:
+        if stored is None or stored['machine'] != machine():
+            stored = dict(machine=machine(), cases={})
+        stored['cases'].update(results)
+        with open(args.baseline, 'w') as file:
+            json.dump(stored, file, indent=1, sort_keys=True)
+
+    if slower:
+        sys.exit('Slower than the baseline: '+', '.join(slower))
@@ -19,7 +19,10 @@ The two main functions are:
     estimation: given the number of periods for convergence, this function
                 estimates the growth factors of the model
 
-There are additional support functions that are explained below.
+There are additional support functions that are explained below. Among them,
+joint_search estimates the growth factors of all the indicators at once, and
+scheduled_search spreads the searches of all the indicators over a shared pool
+of processes.
 
 
 Example
@@ -35,9 +38,9 @@ Rquired external libraries
 --------------------------
 - Numpy
 - Scipy
-- joblib: the joblib library takes care of the parallel processing. It installation
-            is straightforward and the instructions can be found in its
-            Pypi site: https://pypi.org/project/joblib/
+- joblib (optional): the joblib library takes care of the parallel processing
+            with the default backend. It installation is straightforward and 
+            the instructions can be found in its Pypi site: https://pypi.org/project/joblib/
 
 """
 
@@ -45,17 +48,27 @@ Rquired external libraries
 from __future__ import division, print_function
 import numpy as np
 import copy
-from joblib import Parallel, delayed
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import scipy.optimize as opt
 
 # the model_final.py file should be in the same folder
 from ppi import * 
+from stats import RunningStats
+from parallel import ParallelRunner
+from executors import get_executor
 
 
 
-def run_model(I0, T, A, R, phi, tau, alphas, sampleSize):
+def run_model(I0, T, A, R, phi, tau, alphas, sampleSize, batch=False, seeds=None,
+              tol=None, nodes=None, chunkSize=None, return_changes=False, seed=None):
     """Runs the model for a given number of times and returns a matrix with the
     convergence times of each indicator in each simulation.
+    
+    In the adaptive mode (when 'tol' is given), the simulations are run in chunks
+    and the function stops as soon as the standard errors of the mean convergence 
+    times are lower than 'tol', so 'sampleSize' becomes the maximum number of 
+    simulations.
 
     Parameters
     ----------
@@ -87,6 +100,32 @@ def run_model(I0, T, A, R, phi, tau, alphas, sampleSize):
             A vector with the growth factors. Each element shuold be in (0,1).
         sampleSize: int 
             The number of simulations to be performed.
+        batch: bool, optional
+            Whether to run all the simulations at once with PPIModel.run_many 
+            instead of calling run_ppi once per simulation.
+        seeds: list, optional
+            A seed bundle: a list with one seed (int or numpy SeedSequence) per
+            simulation. Calling run_model with the same bundle reuses the same 
+            random numbers (common random numbers), so the differences between
+            the outputs are only due to the differences in the parameters. With 
+            batch=True, each batch of simulations uses a generator created from 
+            the seed of its first simulation. If not given, the global generator 
+            of numpy is used.
+        tol: float, optional
+            The tolerance for the standard error of the mean convergence times.
+            If not given, exactly 'sampleSize' simulations are performed.
+        nodes: numpy array, optional
+            The indices of the indicators whose standard errors are checked 
+            against 'tol'. If not given, all the indicators are checked.
+        chunkSize: int, optional
+            The number of simulations between checks of the standard errors. If 
+            not given, it is a tenth of 'sampleSize' (and at least 10).
+        return_changes: bool, optional
+            Whether to also return the statistics of the changes of the 
+            simulated indicators, which are needed to compute their volatility.
+        seed: int, numpy SeedSequence or numpy Generator, optional
+            If given (and 'seeds' is not), a seed bundle is spawned from it (see
+            spawn_seeds), so the results are reproducible.
         
     Returns
     -------
@@ -94,17 +133,57 @@ def run_model(I0, T, A, R, phi, tau, alphas, sampleSize):
             A matrix with the convergence times of each indicator in each 
             simulation. The rows correspond to the indicators and the columns
             to the simulations.
+        changes: RunningStats
+            Only returned if return_changes=True. The streaming statistics of
+            the changes of all the indicators in all the simulations.
     """
+    if seeds is None and seed is not None:
+        seeds = seed_bundle(sampleSize, seed)
+    if tol is None:
+        chunkSize = sampleSize
+    elif chunkSize is None:
+        chunkSize = max(10, sampleSize//10)
+    if batch:
+        model = PPIModel(I0, T, A=A, alpha=alphas, R=R, phi=phi, tau=tau, tolerance=1e-3)
+    outputs = 'indicators' if return_changes else 'ticks'
+    changes = RunningStats() # streaming statistics of the changes of the indicators
+    
     all_times = []
-    for intera in range(sampleSize):
-        outputs = run_ppi(I0, T, A=A, alpha=alphas, R=R, phi=phi, tau=tau, tolerance=1e-3)
-        tsI, tsC, tsF, tsP, tsD, tsS, times, H = outputs
-        all_times.append(times)
+    while len(all_times) < sampleSize:
+        size = min(chunkSize, sampleSize-len(all_times)) # simulations in this chunk
+        if batch:
+            seed = None if seeds is None else seeds[len(all_times)]
+            results = model.run_many(size, outputs=outputs, seed=seed)
+            if return_changes:
+                all_tsI, results, H = results
+                for tsI in all_tsI:
+                    changes.update(tsI[:,1:]-tsI[:,0:-1])
+            all_times += list(results)
+        else:
+            for intera in range(len(all_times), len(all_times)+size):
+                seed = None if seeds is None else seeds[intera]
+                times = run_ppi(I0, T, A=A, alpha=alphas, R=R, phi=phi, tau=tau, tolerance=1e-3, 
+                                outputs=outputs, seed=seed)
+                if return_changes:
+                    tsI, times, H = times
+                    changes.update(tsI[:,1:]-tsI[:,0:-1])
+                all_times.append(times)
+        
+        # check the standard errors of the mean convergence times
+        if tol is not None and len(all_times) > 1:
+            times = np.array(all_times) if nodes is None else np.array(all_times)[:,nodes]
+            std_errors = times.std(axis=0, ddof=1)/np.sqrt(len(all_times))
+            if np.max(std_errors) < tol:
+                break
+    
     all_times = np.array(all_times).T
+    if return_changes:
+        return all_times, changes
     return all_times
         
         
-def fobj(alpha, node, alphaStar, steps, sampleSize, I0, T, A, R, phi, tau):
+def fobj(alpha, node, alphaStar, steps, sampleSize, I0, T, A, R, phi, tau, seeds=None,
+         tol=None, seed=None):
     """A wrapper around the 'run_model' function that will be used to perform
     the greedy search.
 
@@ -146,6 +225,16 @@ def fobj(alpha, node, alphaStar, steps, sampleSize, I0, T, A, R, phi, tau):
         tau: float, optional 
             Scalar in [0,1] or numpy array (a vector) with values in [0,1] that 
             represent the quality of the rule of law.
+        seeds: list, optional
+            A seed bundle for run_model. Passing the same bundle in every
+            evaluation makes the objective function smooth in 'alpha'.
+        tol: float, optional
+            The tolerance for the standard error of the mean convergence time 
+            of 'node' (see run_model). If not given, exactly 'sampleSize' 
+            simulations are performed.
+        seed: int, numpy SeedSequence or numpy Generator, optional
+            The seed of the simulations when no seed bundle is given (see 
+            run_model).
         
         
     Returns
@@ -156,12 +245,14 @@ def fobj(alpha, node, alphaStar, steps, sampleSize, I0, T, A, R, phi, tau):
     """
     alphas = copy.deepcopy(alphaStar)
     alphas[node] = alpha
-    all_times = run_model(I0, T, A, R, phi, tau, alphas, sampleSize)
+    all_times = run_model(I0, T, A, R, phi, tau, alphas, sampleSize, seeds=seeds, 
+                          tol=tol, nodes=[node], seed=seed)
     errors = (all_times.mean(axis=1)[node] - steps)**2
     return errors
 
 
-def func(I0, T, A, R, phi, tau, node, alphas, steps, sampleSize):
+def func(I0, T, A, R, phi, tau, node, alphas, steps, sampleSize, crn=False, tol=None,
+         seed=None):
     """Greedy search of a growth factor for indicator 'node' that minimizes
     the difference between its convergence time and 'steps'.
 
@@ -201,6 +292,17 @@ def func(I0, T, A, R, phi, tau, node, alphas, steps, sampleSize):
             to evaluate convergence time errors.
         sampleSize: integer 
             The number of simulations to be performed.
+        crn: bool, optional
+            Whether to use common random numbers, i.e. the same seed bundle in
+            every evaluation of the search.
+        tol: float, optional
+            The tolerance for the standard error of the mean convergence time 
+            (see run_model). If not given, exactly 'sampleSize' simulations are
+            performed in each evaluation.
+        seed: int or numpy SeedSequence, optional
+            The seed of the search. If given, the search is reproducible. If not
+            given, the global generator of numpy is used (or fresh entropy for
+            the common random numbers).
         
     Returns
     -------
@@ -208,11 +310,215 @@ def func(I0, T, A, R, phi, tau, node, alphas, steps, sampleSize):
             The growth factor that minimizes the difference between the convergence
             time of 'node' and 'steps', keeping everything else constant.
     """
-    sol = opt.minimize_scalar(fobj, args=(node, alphas, steps, sampleSize, I0, T, A, R, phi, tau), bounds=[.01, .99], method='Bounded')
+    seeds, rng = search_seeds(sampleSize, crn, seed)
+    sol = opt.minimize_scalar(fobj, args=(node, alphas, steps, sampleSize, I0, T, A, R, phi, tau, seeds, tol, rng), bounds=[.01, .99], method='Bounded')
     best_alpha = sol.x
     return best_alpha
 
 
+def joint_search(I0, T, A, R, phi, tau, nodes, alphas, steps, sampleSize,
+                 xtol=.01, batch=True, crn=False, tol=None, seed=None):
+    """Simultaneous search of the growth factors of several indicators that 
+    minimize the difference between their convergence times and 'steps'.
+    
+    The convergence time of an indicator falls as its growth factor rises, so
+    the growth factors of all the 'nodes' are found together by bisection. In
+    each iteration, a single batch of simulations gives the convergence times 
+    of every node, and each node keeps the half of its interval in which 
+    'steps' lies.
+
+    Parameters
+    ----------
+        I0: numpy array 
+            Initial values of the development indicators.
+        T: numpy array 
+            Target values for development indicators.
+        A:  2D numpy array
+            The adjacency matrix of the spillover network of development 
+            indicators.
+        R: numpy array, optional
+            Binary vector indicating which nodes are instrumental (value 1) and 
+            which are not (value 0).
+        phi: float, optional
+            Scalar in [0,1] or numpy array (a vector) with values in [0,1] that 
+            represent the quality of the government's monitoring mechanisms.
+        tau: float, optional 
+            Scalar in [0,1] or numpy array (a vector) with values in [0,1] that 
+            represent the quality of the rule of law.
+        nodes: numpy array
+            The indices (from 0 to N-1) of the nodes whose growth factors are 
+            searched.
+        alphas: numpy array 
+            A vector with the growth factors. The values of the nodes that are
+            not searched are kept constant.
+        steps: int
+            Number of steps to which the simulation should converge.
+        sampleSize: integer 
+            The number of simulations to be performed in each iteration.
+        xtol: float, optional
+            The width of the intervals at which the search stops.
+        batch: bool, optional
+            Whether to run the simulations at once with PPIModel.run_many.
+        crn: bool, optional
+            Whether to use common random numbers, i.e. the same seed bundle in
+            every iteration of the search.
+        tol: float, optional
+            The tolerance for the standard error of the mean convergence times
+            of the nodes (see run_model). If not given, exactly 'sampleSize' 
+            simulations are performed in each iteration.
+        seed: int or numpy SeedSequence, optional
+            The seed of the search. If given, the search is reproducible.
+        
+    Returns
+    -------
+        best_alphas: numpy array
+            The growth factors of 'nodes' (in the same order).
+    """
+    if len(nodes) == 0: # every node already converges close to 'steps'
+        return np.array([])
+    alphas = copy.deepcopy(alphas)
+    lower = np.ones(len(nodes))*.01 # lower bounds of the intervals
+    upper = np.ones(len(nodes))*.99 # upper bounds of the intervals
+    seeds, rng = search_seeds(sampleSize, crn, seed)
+    while np.max(upper-lower) > xtol:
+        middle = (lower+upper)/2
+        alphas[nodes] = middle
+        all_times = run_model(I0, T, A, R, phi, tau, alphas, sampleSize, batch=batch, seeds=seeds,
+                              tol=tol, nodes=nodes, seed=rng)
+        too_slow = all_times.mean(axis=1)[nodes] > steps # nodes that need a larger growth factor
+        lower[too_slow] = middle[too_slow]
+        upper[~too_slow] = middle[~too_slow]
+    best_alphas = (lower+upper)/2
+    return best_alphas
+
+
+def scheduled_search(runner, nodes, alphas, steps, sampleSize, chunkSize=10, crn=False,
+                     seed=None, verbose=True):
+    """Greedy search of the growth factors of several indicators (as in 'func'),
+    where the simulations of all the searches share a pool of processes.
+    
+    The searches are driven by a few threads (twice as many as the processes
+    of the pool), each one searching one node at a time, and each evaluation of
+    an objective function is split into chunks of 'chunkSize' simulations that
+    are queued in the pool. Any idle process takes the next pending chunk, 
+    whatever node and candidate growth factor it belongs to, so a node that 
+    needs many evaluations or long simulations does not leave the other 
+    processes idle. The results do not depend on the number of threads.
+
+    Parameters
+    ----------
+        runner: ParallelRunner
+            The pool of processes, created with the inputs of the model.
+        nodes: numpy array
+            The indices (from 0 to N-1) of the nodes whose growth factors are 
+            searched.
+        alphas: numpy array 
+            A vector with the growth factors. The values of the nodes that are
+            not searched are kept constant.
+        steps: int
+            Number of steps to which the simulation should converge.
+        sampleSize: integer 
+            The number of simulations to be performed in each evaluation.
+        chunkSize: int, optional
+            The number of simulations of each chunk.
+        crn: bool, optional
+            Whether to use common random numbers in the search of each node.
+        seed: int or numpy SeedSequence, optional
+            The seed of the searches. The search of each node gets its own seed,
+            derived from this one (see child_seed).
+        verbose: bool, optional
+            Whether to print the progress each time the search of a node ends.
+        
+    Returns
+    -------
+        best_alphas: numpy array
+            The growth factors of 'nodes' (in the same order).
+    """
+    starts = list(range(0, sampleSize, chunkSize))
+    sizes = [min(chunkSize, sampleSize-start) for start in starts]
+    lock = threading.Lock()
+    progress = dict(nodes=0, chunks=0)
+    
+    def search(node):
+        """Searches the growth factor of one node."""
+        seeds, rng = search_seeds(sampleSize, crn, None if seed is None else child_seed(seed, node))
+        
+        def objective(alpha):
+            candidate = copy.deepcopy(alphas)
+            candidate[node] = alpha
+            if seeds is None:
+                chunk_seeds = spawn_seeds(rng, len(starts))
+            else:
+                chunk_seeds = [seeds[start] for start in starts] # same as run_model with batch=True
+            results = [runner.submit(size, alpha=candidate, seed=chunk_seed) 
+                       for size, chunk_seed in zip(sizes, chunk_seeds)]
+            all_times = np.vstack([result.result() for result in results])
+            with lock:
+                progress['chunks'] += len(results)
+            return (all_times[:,node].mean() - steps)**2
+        
+        sol = opt.minimize_scalar(objective, bounds=[.01, .99], method='Bounded')
+        with lock:
+            progress['nodes'] += 1
+            if verbose:
+                print('Searched', progress['nodes'], 'of', len(nodes), 'growth factors', 
+                      '(' + str(progress['chunks']), 'chunks of simulations)')
+        return sol.x
+    
+    drivers = max(1, min(len(nodes), 2*runner.processes)) # enough searches to keep the pool busy
+    with ThreadPoolExecutor(max_workers=drivers) as threads:
+        best_alphas = np.array(list(threads.map(search, nodes)))
+    return best_alphas
+
+
+def seed_bundle(sampleSize, seed=None):
+    """Creates a seed bundle for run_model with independent seeds.
+
+    Parameters
+    ----------
+        sampleSize: integer 
+            The number of simulations (one seed per simulation).
+        seed: int, numpy SeedSequence or numpy Generator, optional
+            The seed from which the bundle is spawned (see spawn_seeds). If not
+            given, fresh entropy is used.
+        
+    Returns
+    -------
+        seeds: list
+            A list of numpy SeedSequence objects.
+    """
+    seeds = spawn_seeds(seed, sampleSize)
+    return seeds
+
+
+def search_seeds(sampleSize, crn=False, seed=None):
+    """Prepares the random numbers of a search of growth factors.
+
+    Parameters
+    ----------
+        sampleSize: integer 
+            The number of simulations in each evaluation of the search.
+        crn: bool, optional
+            Whether every evaluation uses the same seed bundle.
+        seed: int or numpy SeedSequence, optional
+            The seed of the search.
+        
+    Returns
+    -------
+        seeds: list
+            The seed bundle shared by all the evaluations, or None if crn=False.
+        rng: numpy Generator
+            The generator from which each evaluation spawns its own bundle, or
+            None if crn=True or no seed is given (so the global generator of 
+            numpy is used).
+    """
+    if crn:
+        return seed_bundle(sampleSize, seed), None
+    if seed is None:
+        return None, None
+    return None, np.random.default_rng(seed)
+
+
 def aver_dev(mean_times, steps):
     """Computes the average mean difference between the average convergence times
     and 'steps'.
@@ -235,7 +541,8 @@ def aver_dev(mean_times, steps):
 
 def estimate(I0, T, A, R, phi, tau,
                steps, parallel_processes=4, sample_size=1000, alphas=None, 
-               dev_lim=.8):
+               dev_lim=.8, method='greedy', crn=False, sample_tol=None, seed=None,
+               chunk_size=10, backend='joblib', max_iterations=None, runner=None):
     """Estimates the growth factors for a given number of periods to convergence.
 
     Parameters
@@ -274,6 +581,44 @@ def estimate(I0, T, A, R, phi, tau,
         dev_lim: float, optional
             Tolerance threshold for the difference between the mean convergence 
             times and 'calib_steps'.
+        method: str, optional
+            'greedy' searches the growth factor of each node separately and in
+            parallel (see 'func'). 'joint' searches the growth factors of all
+            the nodes together from shared batches of simulations (see 
+            'joint_search'), which requires far fewer simulations. 'scheduled'
+            runs the same searches as 'greedy' but splits their simulations 
+            into small chunks that are shared by a pool of processes (see 
+            'scheduled_search'), so all the processes are kept busy.
+        crn: bool, optional
+            Whether to use common random numbers in the search of each growth 
+            factor, so the objective function is not noisy.
+        sample_tol: float, optional
+            If given, the searches of the growth factors run adaptive samples of
+            at most 'sample_size' simulations that stop once the standard errors
+            of the mean convergence times are lower than 'sample_tol'. It is not 
+            used by the 'scheduled' method.
+        seed: int or numpy SeedSequence, optional
+            The seed of the estimation. Each search and each batch of simulations
+            gets its own seed, derived from this one and from the iteration and 
+            the node (see child_seed), so the results do not depend on the
+            number of parallel processes. If not given, the results are not 
+            reproducible.
+        chunk_size: int, optional
+            The number of simulations of each chunk in the 'scheduled' method.
+        backend: str, optional
+            How the parallel searches are executed: 'serial', 'thread', 'process',
+            'joblib' or an existing executor (see executors.get_executor). If 
+            the estimation runs inside a parallel task (e.g. several estimations
+            in parallel), the searches run serially.
+        max_iterations: int, optional
+            The maximum number of iterations. If it is reached, the estimation 
+            stops even if the mean absolute deviation is above 'dev_lim'. If not
+            given, the estimation iterates until the deviation is below 'dev_lim'.
+        runner: ParallelRunner, optional
+            An existing runner of the same model for the 'scheduled' method, 
+            e.g. to share its processes among several estimations. It is not 
+            closed by the estimation. If not given, a runner is created with 
+            'parallel_processes' processes and closed at the end.
         
     Returns
     -------
@@ -284,54 +629,86 @@ def estimate(I0, T, A, R, phi, tau,
             A list with the different 'steps' iterated in the function.
     
     """
+    if method not in ('greedy', 'joint', 'scheduled'):
+        raise ValueError("method must be 'greedy', 'joint' or 'scheduled'")
     N = len(R)
     if alphas is  None:
         est_alphas = np.ones(N)*.5
     else:
         est_alphas = copy.deepcopy(alphas)
     
+    def task_seed(*key):
+        """Seed of the task identified by (iteration, node), where the node N 
+        identifies the batches that check the convergence times and the node
+        N+1 the joint and scheduled searches."""
+        return None if seed is None else child_seed(seed, *key)
+    
     print('Number of ticks to convergence:', steps)
-    all_times = run_model(I0, T, A, R, phi, tau, est_alphas, sample_size)
+    all_times = run_model(I0, T, A, R, phi, tau, est_alphas, sample_size, seed=task_seed(0, N))
     mean_devs = aver_dev(all_times.mean(axis=1), steps)
     keep_looking = True
     counter = 1
+    own_runner = executor = None
+    if method == 'scheduled' and runner is None:
+        runner = own_runner = ParallelRunner(I0, T, A, est_alphas, phi, tau, R, processes=parallel_processes,
+                                backend=backend if backend in ('serial', 'thread') else 'process')
+    elif method == 'greedy':
+        executor = get_executor(backend, parallel_processes)
     
-    while keep_looking:
-        print('Running iteration', counter, '...')
-        
-        above_std = np.where(np.abs(all_times.mean(axis=1)-steps) > dev_lim)[0]
-        sol = Parallel(n_jobs=parallel_processes, verbose=0)(delayed(func)(I0, T, A, R, phi, tau, 
-                       node, est_alphas, steps, sample_size) for node in above_std)
-        est_alphas[above_std] = sol
-        all_times = run_model(I0, T, A, R, phi, tau, est_alphas, sample_size)
-        mean_devs = aver_dev(all_times.mean(axis=1), steps)
-        
-        if mean_devs < dev_lim:
-            keep_looking = False
-            out_times = []
-            all_tsI = []
-            for intera in range(sample_size):
-                outputs = run_ppi(I0, T, A=A, alpha=est_alphas, R=R, phi=phi, tau=tau)
-                tsI, tsC, tsF, tsP, tsD, times, tsS, H = outputs
-                out_times.append(times)
-                all_tsI.append(tsI)
-
-            nchs_sim_dist = []
-            for ts in all_tsI:
-                chs_sim = ts[:,1:]-ts[:,0:-1]
-                nchs_sim_dist += chs_sim.flatten().tolist()
-            est_vola = np.std(nchs_sim_dist)
-        counter += 1    
+    try:
+        while keep_looking:
+            print('Running iteration', counter, '...')
+            
+            above_std = np.where(np.abs(all_times.mean(axis=1)-steps) > dev_lim)[0]
+            if method == 'joint':
+                sol = joint_search(I0, T, A, R, phi, tau, above_std, est_alphas, steps, sample_size, 
+                                   crn=crn, tol=sample_tol, seed=task_seed(counter, N+1))
+            elif method == 'scheduled':
+                sol = scheduled_search(runner, above_std, est_alphas, steps, sample_size, chunk_size,
+                                       crn=crn, seed=task_seed(counter, N+1))
+            else:
+                futures = [executor.submit(func, I0, T, A, R, phi, tau, node, est_alphas, steps, 
+                                           sample_size, crn, sample_tol, task_seed(counter, node)) 
+                           for node in above_std]
+                sol = [future.result() for future in futures]
+            est_alphas[above_std] = sol
+            all_times, changes = run_model(I0, T, A, R, phi, tau, est_alphas, sample_size, 
+                                           return_changes=True, seed=task_seed(counter, N))
+            mean_devs = aver_dev(all_times.mean(axis=1), steps)
             
-        print('Obtained a mean average convergence time error of', mean_devs)
+            # the volatility is computed from the same simulations
+            if mean_devs < dev_lim or counter == max_iterations:
+                keep_looking = False
+                est_vola = changes.std
+            counter += 1    
+                
+            print('Obtained a mean average convergence time error of', mean_devs)
+    finally:
+        if own_runner is not None:
+            runner.close()
+        if executor is not None:
+            executor.shutdown()
     
     return est_alphas, est_vola
 
 
 def find_steps(I0, T, A, R, phi, tau, vola_emp, alphas=None,
-              parallel_processes=4, sample_size=10, dev_lim=3, steps=10):
+              parallel_processes=4, sample_size=10, dev_lim=3, steps=10,
+              search='linear', seed=None, backend='joblib', method='greedy'):
     """Iterates over the number of 'steps' to convergence until the total volatility
     of the synthetic indicators is lower than the empirical one.
+    
+    Each estimation of the growth factors starts from the growth factors already
+    estimated for the nearest number of 'steps', so later estimations need fewer
+    iterations. With search='bisect', the function does not scan every value 
+    of 'steps'. Instead, it brackets the first value with a volatility lower 
+    than the empirical one by doubling the increments of 'steps', and then 
+    narrows the bracket by bisection.
+    
+    All the estimations share the same pool of processes (or runner, for the 
+    'scheduled' method), which is created once and closed at the end. The 
+    'joint' method needs no pool, since its batches of simulations run in the
+    calling process.
 
     Parameters
     ----------
@@ -369,6 +746,16 @@ def find_steps(I0, T, A, R, phi, tau, vola_emp, alphas=None,
             times and 'calib_steps'.
         steps: int, optional
             The minimum number of simulation steps for convergence.
+        search: str, optional
+            'linear' increases 'steps' one by one and 'bisect' brackets and 
+            bisects the values of 'steps' (see above).
+        seed: int or numpy SeedSequence, optional
+            The seed of the calibration. The estimation of each value of 'steps'
+            gets its own seed, derived from this one (see child_seed).
+        backend: str, optional
+            How the parallel searches are executed (see estimate).
+        method: str, optional
+            'greedy', 'joint' or 'scheduled' (see estimate).
         
     Returns
     -------
@@ -379,37 +766,80 @@ def find_steps(I0, T, A, R, phi, tau, vola_emp, alphas=None,
             A list with with the total standard deviation of the simulated 
             indicators. Each standard deviation corresponds to each 'calib_steps'.
     rec_steps: list
-            A list with the different 'calib_steps' iterated in the function.
+            A list with the different 'calib_steps' iterated in the function
+            (in increasing order).
     """
+    if search not in ('linear', 'bisect'):
+        raise ValueError("search must be 'linear' or 'bisect'")
+    if method not in ('greedy', 'joint', 'scheduled'):
+        raise ValueError("method must be 'greedy', 'joint' or 'scheduled'")
     N = len(R)
     if alphas is  None:
         alphas = np.ones(N)*.5
-    else:
-        est_alphas = copy.deepcopy(alphas)
-    cont_T = True
     
-    rec_alphas = []
-    rec_volas = []
-    rec_steps = []
+    calibrated = {} # growth factors and volatility of each value of 'steps'
     
-    while cont_T:
-        
+    def calibrate(calib_steps):
+        """Estimates the growth factors for 'calib_steps' starting from the 
+        ones of the nearest value already calibrated."""
+        if len(calibrated) > 0:
+            nearest = min(calibrated, key=lambda s: abs(s-calib_steps))
+            init_alphas = calibrated[nearest][0]
+        else:
+            init_alphas = alphas
         est_alphas, est_vola = estimate(I0=I0, T=T, A=A, R=R, phi=phi, tau=tau,
-                                           steps=steps,
+                                           steps=calib_steps,
                                            parallel_processes=parallel_processes,
-                                           sample_size=sample_size, alphas=alphas, 
-                                           dev_lim=dev_lim,)
-                
-        rec_alphas.append(est_alphas)
-        rec_volas.append(est_vola)
-        rec_steps.append(steps)
-        steps += 1
-                
+                                           sample_size=sample_size, alphas=init_alphas, 
+                                           dev_lim=dev_lim, 
+                                           seed=None if seed is None else child_seed(seed, calib_steps),
+                                           backend=backend if executor is None else executor,
+                                           method=method, runner=runner)
+        calibrated[calib_steps] = (est_alphas, est_vola)
         print('Difference in volatility:', est_vola - vola_emp)
+        return est_vola
+    
+    # a single pool (or runner) for all the estimations
+    runner = executor = None
+    if method == 'scheduled':
+        runner = ParallelRunner(I0, T, A, alphas, phi, tau, R, processes=parallel_processes,
+                                backend=backend if backend in ('serial', 'thread') else 'process')
+    elif method == 'greedy':
+        executor = get_executor(backend, parallel_processes)
+    
+    try:
+        if search == 'linear':
+            while calibrate(steps) >= vola_emp:
+                steps += 1
+    
+        elif calibrate(steps) >= vola_emp:
         
-        if est_vola < vola_emp:
-            cont_T = False
-            
+            # bracket the first value of 'steps' with a lower volatility
+            lower = steps
+            increment = 1
+            upper = lower + increment
+            while calibrate(upper) >= vola_emp:
+                lower = upper
+                increment *= 2
+                upper = lower + increment
+        
+            # bisect the bracket
+            while upper - lower > 1:
+                middle = (lower + upper)//2
+                if calibrate(middle) < vola_emp:
+                    upper = middle
+                else:
+                    lower = middle
+    
+    finally:
+        if runner is not None:
+            runner.close()
+        if executor is not None:
+            executor.shutdown()
+    
+    rec_steps = sorted(calibrated)
+    rec_alphas = [calibrated[s][0] for s in rec_steps]
+    rec_volas = [calibrated[s][1] for s in rec_steps]
             
     return rec_alphas, rec_volas, rec_steps
 
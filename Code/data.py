@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+"""Policy Priority Inference for Sustainable Development - Data Loading
+
+Authors: Omar A. Guerrero & Gonzalo Castañeda
+Written in Pyhton 3.7
+Acknowledgments: This product was developed through the sponsorship of the
+    United Nations Development Programme (bureau for Latin America)
+    and with the support of the National Laboratory for Public Policies (Mexico City),
+    the Centro de Investigación y Docencia Económica (CIDE, Mexico City),
+    and The Alan Turing Institute (London).
+
+This file contains the functions to load the data files of the public repository
+https://github.com/oguerrer/PPI4SD. Text files are slow to parse (especially the
+UTF-16 tables of indicators), so each file is parsed only once and converted into
+a binary cache: a .npy file with its numbers and a small .json index with the rest
+of the information (column names, text columns and the size, modification time
+and hash of the source file). Later loads memory-map the .npy file. If the source
+file changes, its cache is rebuilt. The main functions are:
+
+    load_table: loads a table of indicators, e.g. final_sample_normalized.csv
+    or Subnational_data/samples_normalized/<STATE>.csv, as a pandas DataFrame.
+    load_matrix: loads a matrix or a vector of numbers, e.g. network.csv,
+    alphas.csv or governance_params.csv, as a numpy array.
+    save_network and load_network: save and load a network in a compact binary
+    format (.npz) that only stores its edges, as in a CSR sparse matrix.
+    convert_networks: converts all the text networks of a folder into the 
+    compact format.
+
+The caches are stored in a folder called __ppi_cache__ next to the source files
+(or in another folder given by the user). If the cache cannot be written, the
+files are simply parsed.
+
+
+Example
+-------
+To load the national data:
+
+    data = load_table('National_data/final_sample_normalized.csv')
+    A = load_matrix('National_data/network.csv')
+
+
+Rquired external libraries
+--------------------------
+- Numpy
+- Pandas
+- Scipy (optional): load_network returns a sparse matrix if it is installed.
+
+
+"""
+
+# import necessary libraries
+from __future__ import division, print_function
+import io
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+
+try:
+    import scipy.sparse as sp
+except ImportError:
+    sp = None
+
+# name of the folders with the caches
+CACHE_FOLDER = '__ppi_cache__'
+
+# version of the format of the caches (they are rebuilt if it changes)
+CACHE_VERSION = 1
+
+
+
+def _encoding(path):
+    """Returns the encoding of a text file from its byte order mark."""
+    with open(path, 'rb') as file:
+        start = file.read(2)
+    if start in (b'\xff\xfe', b'\xfe\xff'):
+        return 'utf-16'
+    return 'utf-8'
+
+
+def _digest(path):
+    """Returns the SHA-1 hash of the contents of a file."""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(2**20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _cache_paths(path, cache_dir=None):
+    """Returns the paths of the .npy file and of the index of a source file."""
+    folder = cache_dir if cache_dir is not None else os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_FOLDER)
+    base = os.path.join(folder, os.path.basename(path))
+    return base+'.npy', base+'.json'
+
+
+def _read_index(path, kind, cache_dir=None):
+    """Returns the index of the cache of a source file, or None if there is no
+    valid cache. If the modification time of the source changed but not its
+    contents, the index is updated and the cache is kept."""
+    values_path, index_path = _cache_paths(path, cache_dir)
+    try:
+        with io.open(index_path, encoding='utf-8') as file:
+            index = json.load(file)
+    except (IOError, OSError, ValueError):
+        return None
+    if index.get('version') != CACHE_VERSION or index.get('kind') != kind or not os.path.exists(values_path):
+        return None
+    status = os.stat(path)
+    if index['size'] != status.st_size:
+        return None
+    if index['mtime'] != status.st_mtime_ns:
+        if index['sha1'] != _digest(path):
+            return None
+        index['mtime'] = status.st_mtime_ns
+        _write_index(index_path, index)
+    return index
+
+
+def _write_index(index_path, index):
+    """Writes an index atomically, so concurrent readers never see half of it."""
+    temporary = index_path+'.%i.tmp' % os.getpid()
+    with io.open(temporary, 'w', encoding='utf-8') as file:
+        json.dump(index, file)
+    os.replace(temporary, index_path)
+
+
+def _write_cache(path, kind, values, index, cache_dir=None):
+    """Saves the cache of a source file. Returns whether it could be saved."""
+    values_path, index_path = _cache_paths(path, cache_dir)
+    status = os.stat(path)
+    index.update(version=CACHE_VERSION, kind=kind, size=status.st_size,
+                 mtime=status.st_mtime_ns, sha1=_digest(path))
+    try:
+        if not os.path.exists(os.path.dirname(values_path)):
+            os.makedirs(os.path.dirname(values_path))
+        temporary = values_path+'.%i.tmp.npy' % os.getpid()
+        np.save(temporary, values)
+        os.replace(temporary, values_path)
+        _write_index(index_path, index)
+    except (IOError, OSError):
+        return False
+    return True
+
+
+
+def load_table(path, cache=True, cache_dir=None):
+    """Loads a table of indicators. The encoding (UTF-8 or UTF-16) and the
+    delimiter (tab or comma) are detected from the file.
+
+    Parameters
+    ----------
+        path: str
+            The path of the CSV file.
+        cache: bool, optional
+            Whether to use (and create) the binary cache of the file.
+        cache_dir: str, optional
+            The folder of the cache. By default, it is the folder __ppi_cache__
+            next to the file.
+
+    Returns
+    -------
+        table: pandas DataFrame
+            The table, with the same columns and types as if it was read with
+            pandas.read_csv.
+    """
+    index = _read_index(path, 'table', cache_dir) if cache else None
+    if index is not None:
+        values = np.load(_cache_paths(path, cache_dir)[0], mmap_mode='r')
+        columns = dict((name, values[:,i].astype(index['dtypes'][name]))
+                       for i, name in enumerate(index['numeric']))
+        columns.update(index['text'])
+        return pd.DataFrame(columns, columns=index['columns'])
+
+    encoding = _encoding(path)
+    with io.open(path, encoding=encoding) as file:
+        header = file.readline()
+    table = pd.read_csv(path, sep='\t' if '\t' in header else ',', encoding=encoding,
+                        low_memory=False)
+    if cache:
+        numeric = [name for name in table.columns if pd.api.types.is_numeric_dtype(table[name])]
+        text = [name for name in table.columns if name not in numeric]
+        index = dict(columns=list(table.columns), numeric=numeric,
+                     dtypes=dict((name, str(table[name].dtype)) for name in numeric),
+                     text=dict((name, table[name].tolist()) for name in text))
+        values = table[numeric].values.astype(float)
+        _write_cache(path, 'table', values, index, cache_dir)
+    return table
+
+
+def load_matrix(path, cache=True, cache_dir=None):
+    """Loads a matrix (or a vector) of numbers delimited by commas or whitespace,
+    e.g. a network or a vector of growth factors.
+
+    Parameters
+    ----------
+        path: str
+            The path of the text file.
+        cache: bool, optional
+            Whether to use (and create) the binary cache of the file.
+        cache_dir: str, optional
+            The folder of the cache. By default, it is the folder __ppi_cache__
+            next to the file.
+
+    Returns
+    -------
+        values: numpy array
+            The same array as numpy.loadtxt. When it comes from the cache, it is
+            memory-mapped in copy-on-write mode, so it can be modified without
+            changing the cache.
+    """
+    if cache and _read_index(path, 'matrix', cache_dir) is not None:
+        return np.load(_cache_paths(path, cache_dir)[0], mmap_mode='c')
+
+    with io.open(path, encoding=_encoding(path)) as file:
+        header = file.readline()
+    values = np.loadtxt(path, delimiter=',' if ',' in header else None, encoding=_encoding(path))
+    if cache:
+        _write_cache(path, 'matrix', values, {}, cache_dir)
+    return values
+
+
+
+def save_network(path, A, dtype=np.float64):
+    """Saves a network in a compact binary format that only stores its edges: the
+    arrays of a CSR sparse matrix (the weights, the column of each weight and 
+    the position where each row starts) in a .npz file.
+
+    Parameters
+    ----------
+        path: str
+            The path of the .npz file.
+        A: 2D numpy array or scipy sparse matrix
+            The adjacency matrix of the network.
+        dtype: numpy dtype, optional
+            The type of the weights, e.g. np.float32 to halve the size of the file.
+    """
+    if sp is not None and sp.issparse(A):
+        A = sp.csr_matrix(A)
+        A.eliminate_zeros()
+        A.sort_indices()
+        data, indices, indptr = A.data, A.indices, A.indptr
+    else:
+        A = np.asarray(A)
+        rows, indices = np.nonzero(A)
+        data = A[rows, indices]
+        indptr = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=A.shape[0]))))
+    index_type = np.int32 if len(data) < 2**31 else np.int64
+    np.savez(path, data=np.asarray(data, dtype=dtype), indices=np.asarray(indices, dtype=index_type),
+             indptr=np.asarray(indptr, dtype=index_type), shape=np.array(A.shape))
+
+
+def load_network(path, sparse=True):
+    """Loads a network saved with save_network or, if the file is not a .npz
+    file, a text network (see load_matrix).
+
+    Parameters
+    ----------
+        path: str
+            The path of the file.
+        sparse: bool, optional
+            Whether to return a scipy sparse matrix (CSR), which can be passed
+            directly to run_ppi and the other functions of the model. It requires
+            Scipy.
+
+    Returns
+    -------
+        A: scipy sparse matrix or 2D numpy array
+            The adjacency matrix of the network.
+    """
+    if not path.endswith('.npz'):
+        A = load_matrix(path)
+        return sp.csr_matrix(A) if sparse and sp is not None else A
+    with np.load(path) as arrays:
+        data, indices, indptr = arrays['data'], arrays['indices'], arrays['indptr']
+        shape = tuple(arrays['shape'])
+    if sparse:
+        if sp is None:
+            raise ImportError('Scipy is required to load sparse networks')
+        return sp.csr_matrix((data, indices, indptr), shape=shape)
+    A = np.zeros(shape, dtype=data.dtype)
+    A[np.repeat(np.arange(shape[0]), np.diff(indptr)), indices] = data
+    return A
+
+
+def convert_networks(folder, output=None, dtype=np.float64):
+    """Converts all the text networks (.csv files) of a folder into the compact
+    format of save_network.
+
+    Parameters
+    ----------
+        folder: str
+            The folder with the networks, e.g. Subnational_data/networks.
+        output: str, optional
+            The folder of the .npz files. By default, they are saved next to the
+            text files (e.g. networks/AGU.csv becomes networks/AGU.npz).
+        dtype: numpy dtype, optional
+            The type of the weights (see save_network).
+
+    Returns
+    -------
+        paths: list
+            The paths of the new files.
+    """
+    if output is None:
+        output = folder
+    elif not os.path.exists(output):
+        os.makedirs(output)
+    paths = []
+    for file in sorted(os.listdir(folder)):
+        if file.endswith('.csv'):
+            path = os.path.join(output, file[0:-4]+'.npz')
+            save_network(path, load_matrix(os.path.join(folder, file), cache=False), dtype=dtype)
+            paths.append(path)
+    return paths
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+"""Policy Priority Inference for Sustainable Development - Statistical Equivalence
+
+Authors: Omar A. Guerrero & Gonzalo Castañeda
+Written in Pyhton 3.7
+Acknowledgments: This product was developed through the sponsorship of the
+    United Nations Development Programme (bureau for Latin America)
+    and with the support of the National Laboratory for Public Policies (Mexico City),
+    the Centro de Investigación y Docencia Económica (CIDE, Mexico City),
+    and The Alan Turing Institute (London).
+
+This file contains a harness to check that a faster engine of the model (e.g.
+PPIModel with several replicas, float32 arithmetic or sparse networks) simulates
+the same model as the reference implementation (run_ppi). The engines draw their
+random numbers in a different order, so their simulations cannot be compared one
+by one. Instead, the harness runs many simulations with each engine and compares
+the distributions of their outputs with two-sample Kolmogorov-Smirnov tests:
+
+    ticks: the convergence time of each indicator.
+    H: the final historical inefficiencies of each instrumental indicator.
+    P: the allocation profile, i.e. the allocation to each instrumental
+    indicator at several periods of the simulation.
+    I: the trajectories of the indicators, i.e. the value of each indicator at
+    several periods of the simulation.
+
+Since hundreds of tests are performed, the p-values are adjusted for multiple
+comparisons (Holm or Bonferroni), so the probability that an equivalent engine
+fails the check (a false alarm) is at most the chosen significance level. The
+main functions are:
+
+    check_engine: runs the reference and a candidate engine on the same inputs
+    and compares their outputs.
+    compare_outputs: compares the outputs of two engines.
+    national_inputs and state_inputs: load the inputs of the model from the
+    national and subnational data folders.
+
+The file can also be run as a script to check several engines on the national
+data and on some states (python equivalence.py --help).
+
+
+Example
+-------
+To check the batched engine on the national data:
+
+    inputs = national_inputs()
+    passed, tests = check_engine('batch', inputs, n_sims=200, seed=0)
+    print(tests[tests.rejected])
+
+
+Rquired external libraries
+--------------------------
+- Numpy
+- Pandas
+- Scipy
+
+
+"""
+
+# import necessary libraries
+from __future__ import division, print_function
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+from scipy.stats import ks_2samp
+
+# the ppi.py file should be in the same folder
+from ppi import run_ppi, run_ppi_batch, PPIModel, spawn_seeds, child_seed, get_targets
+from data import load_table, load_matrix
+
+FOLDER = os.path.dirname(os.path.abspath(__file__))
+NATIONAL = os.path.join(FOLDER, '..', 'National_data')
+SUBNATIONAL = os.path.join(FOLDER, '..', 'Subnational_data')
+
+
+
+def _collect(tsI, tsP, ticks, H):
+    """Groups the outputs of the simulations of an engine."""
+    return dict(I=list(tsI), P=list(tsP), ticks=np.array(ticks), H=np.array(H))
+
+
+def reference_engine(inputs, n_sims, seed=None, **kwargs):
+    """Simulates with run_ppi, one simulation at a time."""
+    outputs = [run_ppi(seed=sim_seed, **dict(inputs, **kwargs)) for sim_seed in spawn_seeds(seed, n_sims)]
+    return _collect([out[0] for out in outputs], [out[3] for out in outputs],
+                    [out[6] for out in outputs], [out[7] for out in outputs])
+
+
+def sparse_engine(inputs, n_sims, seed=None):
+    """Simulates with run_ppi and a sparse network."""
+    return reference_engine(inputs, n_sims, seed, sparse=True)
+
+
+def batch_engine(inputs, n_sims, seed=None):
+    """Simulates all the replicas at once with run_ppi_batch."""
+    tsI, tsC, tsF, tsP, tsD, tsS, ticks, H = run_ppi_batch(n_replicas=n_sims, seed=seed, **inputs)
+    return _collect(tsI, tsP, ticks, H)
+
+
+def float32_engine(inputs, n_sims, seed=None):
+    """Simulates all the replicas at once with PPIModel in single precision."""
+    model = PPIModel(dtype=np.float32, **inputs)
+    tsI, tsC, tsF, tsP, tsD, tsS, ticks, H = model.run_many(n_sims, seed=seed)
+    return _collect(tsI, tsP, ticks, H)
+
+
+ENGINES = dict(reference=reference_engine, sparse=sparse_engine, batch=batch_engine,
+               float32=float32_engine)
+
+
+
+def _at_periods(series, periods):
+    """Returns the values of several time series (a list of matrices with one
+    column per period) at the given periods, as a matrix with one row per
+    series. The series that end before a period keep their final values."""
+    return np.array([np.concatenate([matrix[:, min(period, matrix.shape[1]-1)] for period in periods])
+                     for matrix in series])
+
+
+def adjust_pvalues(pvalues, correction='holm'):
+    """Adjusts p-values for multiple comparisons.
+
+    Parameters
+    ----------
+        pvalues: numpy array
+            The p-values of the tests.
+        correction: str, optional
+            'holm' (Holm-Bonferroni step-down method) or 'bonferroni'. Both
+            control the probability of rejecting any true null hypothesis.
+
+    Returns
+    -------
+        adjusted: numpy array
+            The adjusted p-values. A test is rejected at a significance level
+            alpha if its adjusted p-value is lower than or equal to alpha.
+    """
+    pvalues = np.asarray(pvalues, dtype=float)
+    m = len(pvalues)
+    if correction == 'bonferroni':
+        return np.minimum(pvalues*m, 1)
+    if correction != 'holm':
+        raise ValueError("correction must be 'holm' or 'bonferroni'")
+    order = np.argsort(pvalues)
+    adjusted = np.empty(m)
+    adjusted[order] = np.minimum(np.maximum.accumulate(pvalues[order]*(m-np.arange(m))), 1)
+    return adjusted
+
+
+def compare_outputs(reference, candidate, alpha=.05, correction='holm', periods=None, decimals=4):
+    """Compares the outputs of two engines with two-sample Kolmogorov-Smirnov
+    tests, one per indicator and quantity (see above).
+
+    Parameters
+    ----------
+        reference: dictionary
+            The outputs of the reference engine, as returned by the functions
+            of ENGINES: the time series of the indicators ('I') and allocations
+            ('P') of each simulation, and the matrices of convergence times
+            ('ticks') and historical inefficiencies ('H').
+        candidate: dictionary
+            The outputs of the candidate engine, in the same format.
+        alpha: float, optional
+            The significance level, i.e. the maximum probability of a false
+            alarm for the whole comparison.
+        correction: str, optional
+            The adjustment for multiple comparisons (see adjust_pvalues).
+        periods: list, optional
+            The periods at which the time series are compared. If not given,
+            they are the periods at a quarter, half and three quarters of the
+            median length of the reference simulations.
+        decimals: int, optional
+            The outputs are rounded to this number of decimals before the tests.
+            The indicators only take a few discrete values (they depend on the 
+            number of periods with successful growth), so, without rounding, the
+            test would tell apart engines whose values only differ in their 
+            rounding errors (e.g. float32 and float64).
+
+    Returns
+    -------
+        passed: bool
+            Whether no test was rejected.
+        tests: pandas DataFrame
+            One row per test with the quantity, the indicator, the period (for
+            the time series), the Kolmogorov-Smirnov statistic, the p-value, the
+            adjusted p-value and whether the test was rejected.
+    """
+    if periods is None:
+        length = np.median([matrix.shape[1] for matrix in reference['I']])
+        periods = sorted(set(int(length*fraction) for fraction in (.25, .5, .75)))
+    samples = [('ticks', reference['ticks'], candidate['ticks'], [None]),
+               ('H', reference['H'], candidate['H'], [None])]
+    for quantity in ('I', 'P'):
+        if quantity in reference and quantity in candidate:
+            samples.append((quantity, _at_periods(reference[quantity], periods),
+                            _at_periods(candidate[quantity], periods), periods))
+
+    rows = []
+    for quantity, sample1, sample2, quantity_periods in samples:
+        size = sample1.shape[1]//len(quantity_periods) # number of indicators
+        for column in range(sample1.shape[1]):
+            statistic, pvalue = ks_2samp(np.round(sample1[:, column].astype(float), decimals),
+                                         np.round(sample2[:, column].astype(float), decimals))
+            rows.append([quantity, column%size, quantity_periods[column//size], statistic, pvalue])
+
+    tests = pd.DataFrame(rows, columns=['quantity', 'indicator', 'period', 'statistic', 'pvalue'])
+    tests['adjusted'] = adjust_pvalues(tests['pvalue'].values, correction)
+    tests['rejected'] = tests['adjusted'] <= alpha
+    return not tests['rejected'].any(), tests
+
+
+def check_engine(engine, inputs, n_sims=200, alpha=.05, correction='holm', periods=None, decimals=4,
+                 seed=None):
+    """Runs the reference implementation (run_ppi) and a candidate engine on the
+    same inputs, and compares the distributions of their outputs.
+
+    Parameters
+    ----------
+        engine: str or function
+            The name of an engine of ENGINES or a function that receives the
+            inputs, the number of simulations and a seed, and returns the
+            outputs in the same format as the functions of ENGINES.
+        inputs: dictionary
+            The arguments of run_ppi (e.g. I0, T, A, R, alpha, phi and tau).
+        n_sims: int, optional
+            The number of simulations of each engine. More simulations detect
+            smaller differences.
+        alpha, correction, periods, decimals: optional
+            The parameters of the comparison (see compare_outputs).
+        seed: int or numpy SeedSequence, optional
+            The seed of the check. The two engines get independent seeds
+            derived from it.
+
+    Returns
+    -------
+        The outputs of compare_outputs.
+    """
+    if not callable(engine):
+        if engine not in ENGINES:
+            raise ValueError('engine must be one of: '+', '.join(sorted(ENGINES)))
+        engine = ENGINES[engine]
+    reference = reference_engine(inputs, n_sims, child_seed(seed, 0))
+    candidate = engine(inputs, n_sims, child_seed(seed, 1))
+    return compare_outputs(reference, candidate, alpha, correction, periods, decimals)
+
+
+
+def national_inputs(folder=NATIONAL):
+    """Loads the inputs of the model from the national data folder.
+
+    Parameters
+    ----------
+        folder: str, optional
+            The path of the national data folder.
+
+    Returns
+    -------
+        inputs: dictionary
+            The arguments of run_ppi: I0, T, A, R, alpha, phi and tau.
+    """
+    data = load_table(os.path.join(folder, 'final_sample_normalized.csv'))
+    years = [column for column in data.columns if column.isdigit()]
+    I0, T = get_targets(data[years].values)
+    phi, tau = load_matrix(os.path.join(folder, 'governance_params.csv'))
+    return dict(I0=I0, T=T, A=np.array(load_matrix(os.path.join(folder, 'network.csv'))),
+                R=data['instrumental'].values, alpha=np.array(load_matrix(os.path.join(folder, 'alphas.csv'))),
+                phi=phi, tau=tau)
+
+
+def state_inputs(state, phi, tau, folder=SUBNATIONAL):
+    """Loads the inputs of the model for a state from the subnational data folder.
+
+    Parameters
+    ----------
+        state: str
+            The code of the state (e.g. 'AGU').
+        phi: float
+            The quality of the monitoring mechanisms.
+        tau: float
+            The quality of the rule of law.
+        folder: str, optional
+            The path of the subnational data folder.
+
+    Returns
+    -------
+        inputs: dictionary
+            The arguments of run_ppi: I0, T, A, R, alpha, phi and tau, where
+            the growth factors are the ones calibrated for the state.
+    """
+    from subnational import load_state
+    data = load_state(folder, state)
+    alphas = np.array(load_matrix(os.path.join(folder, 'alphas', state+'.csv')))
+    return dict(I0=data['I0'], T=data['T'], A=data['A'], R=data['R'], alpha=alphas, phi=phi, tau=tau)
+
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Checks engines of PPI against run_ppi.')
+    parser.add_argument('engines', nargs='*', default=['batch', 'float32', 'sparse'],
+                        help="engines to check ('reference' checks run_ppi against itself)")
+    parser.add_argument('--states', nargs='*', default=['AGU', 'CMX'], help='states to check')
+    parser.add_argument('--sims', type=int, default=200, help='simulations of each engine')
+    parser.add_argument('--alpha', type=float, default=.05, help='significance level')
+    parser.add_argument('--correction', default='holm', help="'holm' or 'bonferroni'")
+    parser.add_argument('--seed', type=int, default=0, help='seed of the checks')
+    args = parser.parse_args()
+
+    national = national_inputs()
+    datasets = [('national', national)]
+    datasets += [(state, state_inputs(state, national['phi'], national['tau'])) for state in args.states]
+
+    failed = False
+    print('%-10s%-10s%8s%10s%14s' % ('engine', 'data', 'tests', 'rejected', 'min adj. p'))
+    for i, engine in enumerate(args.engines):
+        for j, (name, inputs) in enumerate(datasets):
+            passed, tests = check_engine(engine, inputs, args.sims, args.alpha, args.correction,
+                                         seed=child_seed(args.seed, i, j))
+            print('%-10s%-10s%8i%10i%14.4f  %s' % (engine, name, len(tests), tests['rejected'].sum(),
+                                                  tests['adjusted'].min(), 'PASS' if passed else 'FAIL'))
+            if not passed:
+                failed = True
+                print(tests[tests['rejected']].to_string(index=False))
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""Policy Priority Inference for Sustainable Development - Parallel Backends
+
+Authors: Omar A. Guerrero & Gonzalo Castañeda
+Written in Pyhton 3.7
+Acknowledgments: This product was developed through the sponsorship of the
+    United Nations Development Programme (bureau for Latin America)
+    and with the support of the National Laboratory for Public Policies (Mexico City),
+    the Centro de Investigación y Docencia Económica (CIDE, Mexico City),
+    and The Alan Turing Institute (London).
+
+This file contains the tools to choose how the parallel parts of the calibration
+and of the Monte Carlo simulations are executed. All the backends follow the
+interface of the executors of the concurrent.futures module (submit, map and
+shutdown):
+
+    'serial': runs each task when it is submitted, in the same thread.
+    'thread': runs the tasks in a pool of threads. It suits large networks,
+    since numpy releases the GIL in the matrix products.
+    'process': runs the tasks in a pool of processes. It suits small networks,
+    where the Python overhead of each step dominates.
+    'joblib': runs the tasks in the reusable pool of processes of joblib (loky).
+
+The tasks submitted to a parallel backend are marked as nested, so any parallel
+computation that they start (e.g. the estimation of a state while several states
+are calibrated in parallel) runs serially instead of oversubscribing the cores.
+
+
+Example
+-------
+To run a function over several inputs in 4 threads:
+
+    with get_executor('thread', 4) as executor:
+        results = list(executor.map(function, inputs))
+
+
+Rquired external libraries
+--------------------------
+- joblib (only for the 'joblib' backend)
+
+
+"""
+
+# import necessary libraries
+from __future__ import division, print_function
+import threading
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, ProcessPoolExecutor
+
+BACKENDS = ('serial', 'thread', 'process', 'joblib')
+
+# whether the current thread runs a task of a parallel backend
+_context = threading.local()
+
+
+
+def is_nested():
+    """Returns whether the caller runs inside a task of a parallel backend."""
+    return getattr(_context, 'nested', False)
+
+
+def _call_nested(function, args, kwargs):
+    """Calls a function marking the current thread as nested."""
+    previous = is_nested()
+    _context.nested = True
+    try:
+        return function(*args, **kwargs)
+    finally:
+        _context.nested = previous
+
+
+
+class SerialExecutor(Executor):
+    """An executor that runs each task when it is submitted."""
+
+    def submit(self, function, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(function(*args, **kwargs))
+        except BaseException as error:
+            future.set_exception(error)
+        return future
+
+
+
+class NestedExecutor(Executor):
+    """An executor that marks the tasks that it runs as nested (see is_nested).
+
+    Parameters
+    ----------
+        executor: concurrent.futures Executor
+            The executor that runs the tasks.
+        reusable: bool, optional
+            Whether the executor is shared with other users, in which case it
+            is not shut down with this one.
+    """
+
+    def __init__(self, executor, reusable=False):
+        self.executor = executor
+        self.reusable = reusable
+
+    def submit(self, function, *args, **kwargs):
+        return self.executor.submit(_call_nested, function, args, kwargs)
+
+    def shutdown(self, wait=True, **kwargs):
+        if not self.reusable:
+            self.executor.shutdown(wait=wait)
+
+
+
+def get_executor(backend='process', workers=4):
+    """Creates an executor for the parallel tasks.
+
+    Parameters
+    ----------
+        backend: str or concurrent.futures Executor, optional
+            'serial', 'thread', 'process' or 'joblib' (see above). It can also
+            be an existing executor, e.g. to share a pool of processes among 
+            several computations, in which case it is not shut down with the 
+            returned executor.
+        workers: int, optional
+            The number of threads or processes.
+
+    Returns
+    -------
+        executor: concurrent.futures Executor
+            The executor. It is serial if 'workers' is 1 or if the caller runs
+            inside a task of another parallel executor. It should be shut down
+            after use (or used in a 'with' statement).
+    """
+    if isinstance(backend, Executor):
+        return NestedExecutor(backend, reusable=True)
+    if backend not in BACKENDS:
+        raise ValueError("backend must be 'serial', 'thread', 'process' or 'joblib'")
+    if backend == 'serial' or workers == 1 or is_nested():
+        return SerialExecutor()
+    if backend == 'thread':
+        return NestedExecutor(ThreadPoolExecutor(workers))
+    if backend == 'process':
+        return NestedExecutor(ProcessPoolExecutor(workers))
+    from joblib.externals.loky import get_reusable_executor
+    return NestedExecutor(get_reusable_executor(max_workers=workers), reusable=True)
@@ -0,0 +1,384 @@
+# -*- coding: utf-8 -*-
+"""Policy Priority Inference for Sustainable Development - Parallel Simulations
+
+Authors: Omar A. Guerrero & Gonzalo Castañeda
+Written in Pyhton 3.7
+Acknowledgments: This product was developed through the sponsorship of the
+    United Nations Development Programme (bureau for Latin America)
+    and with the support of the National Laboratory for Public Policies (Mexico City),
+    the Centro de Investigación y Docencia Económica (CIDE, Mexico City),
+    and The Alan Turing Institute (London).
+
+This file contains the tools to run many simulations of the model in several
+processes. The inputs of the model (the network, the initial values, the targets,
+the growth factors, etc.) are placed in shared memory only once, so they are not
+copied into every task, and the processes write the final results directly
+into shared arrays. The two main tools are:
+
+    ParallelRunner: a class that keeps the inputs of a model in shared memory
+    and a pool of processes that simulate it.
+    run_ppi_parallel: a function that simulates several independent replicas
+    in parallel, with the same outputs as run_ppi_batch.
+
+The replicas are simulated in chunks. Each chunk has its own random number
+generator, spawned from the seed of the run, so the results depend on the seed
+and the size of the chunks but not on the number of processes.
+
+
+Example
+-------
+To simulate 10,000 replicas in 8 processes:
+
+    ticks = run_ppi_parallel(I0, T, A, alpha, phi, tau, R, n_replicas=10000,
+                             processes=8, outputs='ticks', seed=0)
+
+
+Rquired external libraries
+--------------------------
+- Numpy
+- Scipy (optional): used when the network is sparse.
+
+
+"""
+
+# import necessary libraries
+from __future__ import division, print_function
+import numpy as np
+import copy
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+# the ppi.py file should be in the same folder
+from ppi import PPIModel, spawn_seeds, sp
+from executors import NestedExecutor, get_executor, is_nested
+
+# outputs that are written by the processes directly into shared arrays
+SHARED_OUTPUTS = ('final', 'ticks')
+FINAL_NAMES = {'final': ('I', 'P', 'ticks', 'H'), 'ticks': ('ticks',)}
+
+# the model of each process, created once when the process starts
+_worker = {}
+
+
+
+class SharedArrays(object):
+    """A collection of numpy arrays stored in shared memory blocks.
+
+    The arrays are copied into shared memory when they are added, and can be
+    attached by other processes through the description returned by 'spec',
+    without copying them.
+    """
+
+    def __init__(self):
+        self.blocks = {} # shared memory blocks
+        self.arrays = {} # arrays that view the blocks
+
+    def add(self, name, value):
+        """Copies an array into a new shared memory block and returns a view of it."""
+        value = np.ascontiguousarray(value)
+        block = shared_memory.SharedMemory(create=True, size=max(value.nbytes, 1))
+        array = np.ndarray(value.shape, dtype=value.dtype, buffer=block.buf)
+        array[...] = value
+        self.blocks[name] = block
+        self.arrays[name] = array
+        return array
+
+    def spec(self):
+        """Returns the names of the blocks and the shapes and types of the arrays."""
+        return dict((name, (self.blocks[name].name, array.shape, array.dtype.str))
+                    for name, array in self.arrays.items())
+
+    def close(self):
+        """Releases and removes all the shared memory blocks."""
+        self.arrays = {}
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+        self.blocks = {}
+
+    @staticmethod
+    def attach(spec):
+        """Attaches the arrays described by 'spec' (see SharedArrays.spec).
+
+        Returns
+        -------
+            arrays: dictionary
+                The arrays, by name.
+            blocks: list
+                The shared memory blocks, which should be kept while the arrays
+                are in use.
+        """
+        arrays, blocks = {}, []
+        for name, (block_name, shape, dtype) in spec.items():
+            block = shared_memory.SharedMemory(name=block_name)
+            arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+            blocks.append(block)
+        return arrays, blocks
+
+
+
+def _init_worker(attributes, spec, sparse_names):
+    """Creates the model of a process from the inputs in shared memory."""
+    arrays, blocks = SharedArrays.attach(spec)
+    model = PPIModel.__new__(PPIModel)
+    model.__dict__.update(attributes)
+    for name, array in arrays.items():
+        if name.rsplit('_', 1)[0] not in sparse_names:
+            setattr(model, name, array)
+    for name in sparse_names: # rebuild the sparse matrices on top of the shared arrays
+        parts = tuple(arrays[name+'_'+part] for part in ('data', 'indices', 'indptr'))
+        setattr(model, name, sp.csr_matrix(parts, shape=attributes[name+'_shape'], copy=False))
+    if 'At' not in sparse_names:
+        model.At_dense = model.At.T # network for dense products
+    _worker['model'] = model
+    _worker['blocks'] = blocks
+
+
+
+def _run_chunk(start, size, seed, alpha, P0, H0, outputs, spec, model=None):
+    """Simulates a chunk of replicas with the given model or, by default, with
+    the model of the process. The final outputs are written into the shared
+    arrays described by 'spec' (if given) and the rest of the outputs are 
+    returned."""
+    if model is None:
+        model = _worker['model']
+    if alpha is not None:
+        model = copy.copy(model)
+        model.alpha = model._internal(alpha)
+    results = model.run_many(size, P0=P0, H0=H0, outputs=outputs, seed=seed)
+    if outputs not in SHARED_OUTPUTS or spec is None:
+        return results
+    if outputs == 'ticks':
+        results = (results,)
+    arrays, blocks = SharedArrays.attach(spec)
+    for name, result in zip(FINAL_NAMES[outputs], results):
+        arrays[name][start:start+size] = result
+    del arrays
+    for block in blocks:
+        block.close()
+    return None
+
+
+
+class ParallelRunner(object):
+    """A pool of processes that simulate a model whose inputs are kept in
+    shared memory.
+
+    The inputs are validated once by PPIModel and its arrays are copied into
+    shared memory. Each process attaches them when it starts, so the tasks
+    only carry the number of replicas to simulate and their seeds. The runner
+    should be closed after use (or used in a 'with' statement) to terminate
+    the processes and release the shared memory.
+    
+    The simulations can also run in threads (or serially), which share the 
+    model without copying it. If the runner is created inside a task of 
+    another parallel executor, it runs serially (see executors.is_nested).
+
+    Parameters
+    ----------
+        I0, T, A, alpha, phi, tau, R, gov_func, PF, pf, tolerance, sparse, dtype:
+            The inputs of the model (see PPIModel). The function gov_func must
+            be defined at the top level of a module so it can be sent to the
+            processes.
+        processes: int, optional
+            The number of processes (or threads).
+        backend: str, optional
+            'process', 'thread' or 'serial' (see executors.get_executor).
+    """
+
+    def __init__(self, I0, T, A=None, alpha=.1, phi=.5, tau=.5, R=None,
+                 gov_func=None, PF=None, pf=1, tolerance=1e-3, sparse=None,
+                 dtype=np.float64, processes=4, backend='process'):
+
+        if backend not in ('serial', 'thread', 'process'):
+            raise ValueError("backend must be 'serial', 'thread' or 'process'")
+        self.model = model = PPIModel(I0, T, A, alpha, phi, tau, R, gov_func,
+                                      PF, pf, tolerance, sparse, dtype)
+        self.processes = processes
+        self.shared = SharedArrays()
+        if backend != 'process' or processes == 1 or is_nested():
+            self.local = True # the model is used directly by the threads
+            self.executor = get_executor(backend if backend != 'process' else 'serial', processes)
+            return
+        self.local = False
+
+        # separate the arrays, which go into shared memory, from the rest of the inputs
+        attributes, sparse_names = {}, []
+        for name, value in model.__dict__.items():
+            if sp is not None and sp.issparse(value):
+                for part in ('data', 'indices', 'indptr'):
+                    self.shared.add(name+'_'+part, getattr(value, part))
+                attributes[name+'_shape'] = value.shape
+                sparse_names.append(name)
+            elif isinstance(value, np.ndarray) and value.ndim > 0:
+                if name != 'At_dense': # the transposed view is rebuilt by the processes
+                    self.shared.add(name, value)
+            else:
+                attributes[name] = value
+        self.executor = NestedExecutor(ProcessPoolExecutor(processes, initializer=_init_worker,
+                                                           initargs=(attributes, self.shared.spec(), sparse_names)))
+
+
+    def _alpha(self, alpha):
+        """Validates growth factors that replace the ones of the model."""
+        if alpha is None:
+            return None
+        alpha = self.model._param(alpha, (self.model.N,), 'alpha')
+        if np.any(alpha <= 0) or np.any(alpha >= 1):
+            raise ValueError('alpha must be in (0,1)')
+        return alpha
+
+
+    def run(self, n_replicas=1000, alpha=None, P0=None, H0=None, outputs='ticks',
+            seed=None, chunk_size=100):
+        """Runs several independent simulations of the model in parallel.
+
+        Parameters
+        ----------
+            n_replicas: int, optional
+                The number of simulations to be performed.
+            alpha: numpy array, optional
+                Growth factors that replace the ones of the model in this run,
+                e.g. to evaluate different candidates during a calibration.
+            P0: numpy array, optional
+                An array with the initial allocation profile.
+            H0: numpy array, optional
+                The initial vector of historical inefficiencies.
+            outputs: str, optional
+                The outputs to be returned: 'all', 'indicators', 'final' or
+                'ticks' (see run_ppi). The final outputs ('final' and 'ticks')
+                are written by the processes directly into shared memory, while
+                the time series are sent back to the main process.
+            seed: int, numpy SeedSequence or numpy Generator, optional
+                The seed from which the generator of each chunk is spawned (see
+                spawn_seeds). If not given, fresh entropy is used.
+            chunk_size: int, optional
+                The number of replicas simulated in each task.
+
+        Returns
+        -------
+            The same outputs as run_ppi_batch.
+        """
+        if outputs not in ('all', 'indicators', 'final', 'ticks'):
+            raise ValueError("outputs must be 'all', 'indicators', 'final' or 'ticks'")
+        alpha = self._alpha(alpha)
+
+        starts = list(range(0, n_replicas, chunk_size))
+        sizes = [min(chunk_size, n_replicas-start) for start in starts]
+        seeds = spawn_seeds(seed, len(starts)) # one independent stream per chunk
+
+        # shared arrays where the processes write the final outputs
+        model = self.model
+        K, N, n = n_replicas, model.N, model.n
+        shapes = dict(ticks=((K, N), np.float64), I=((K, N), model.dtype),
+                      P=((K, n), model.dtype), H=((K, n), model.dtype))
+        names = FINAL_NAMES.get(outputs, ())
+        results = SharedArrays()
+        try:
+            for name in names:
+                shape, dtype = shapes[name]
+                results.add(name, np.zeros(shape, dtype=dtype))
+            futures = [self._submit(start, size, chunk_seed, alpha, P0, H0, outputs, results.spec())
+                       for start, size, chunk_seed in zip(starts, sizes, seeds)]
+            chunks = [future.result() for future in futures]
+            finals = [results.arrays[name].copy() for name in names]
+        finally:
+            results.close()
+
+        if outputs == 'ticks':
+            return finals[0]
+        elif outputs == 'final':
+            return tuple(finals)
+
+        # gather the time series of the chunks
+        gathered = []
+        for i in range(len(chunks[0])):
+            if isinstance(chunks[0][i], list):
+                gathered.append([series for chunk in chunks for series in chunk[i]])
+            else:
+                gathered.append(np.vstack([chunk[i] for chunk in chunks]))
+        return tuple(gathered)
+
+
+    def _submit(self, *args):
+        """Queues a chunk of simulations (see _run_chunk)."""
+        if self.local:
+            return self.executor.submit(_run_chunk, *args, model=self.model)
+        return self.executor.submit(_run_chunk, *args)
+
+
+    def submit(self, n_replicas, alpha=None, P0=None, H0=None, outputs='ticks',
+               seed=None):
+        """Queues a single chunk of simulations without waiting for it. The 
+        chunks are run in the order in which they are queued by the first
+        process that becomes idle, so several searches (e.g. in different 
+        threads) can share the processes.
+
+        Parameters
+        ----------
+            n_replicas: int
+                The number of simulations of the chunk.
+            alpha, P0, H0, outputs:
+                The same as in ParallelRunner.run.
+            seed: int, numpy SeedSequence or numpy Generator, optional
+                The seed of the chunk's generator. If not given, fresh entropy
+                is used.
+
+        Returns
+        -------
+            future: concurrent.futures Future
+                Its method 'result' waits for the chunk and returns the same 
+                outputs as run_ppi_batch.
+        """
+        if outputs not in ('all', 'indicators', 'final', 'ticks'):
+            raise ValueError("outputs must be 'all', 'indicators', 'final' or 'ticks'")
+        alpha = self._alpha(alpha)
+        if seed is None:
+            seed = np.random.SeedSequence()
+        return self._submit(0, n_replicas, seed, alpha, P0, H0, outputs, None)
+
+
+    def close(self):
+        """Terminates the processes and releases the shared memory."""
+        self.executor.shutdown()
+        self.shared.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+
+
+def run_ppi_parallel(I0, T, A=None, alpha=.1, phi=.5, tau=.5, R=None,
+                     gov_func=None, P0=None, H0=None, PF=None, pf=1, tolerance=1e-3,
+                     n_replicas=1000, outputs='ticks', sparse=None, seed=None,
+                     processes=4, chunk_size=100, backend='process'):
+    """Runs several independent simulations of the model in parallel processes
+    that share the inputs of the model. The parameters are the same as in
+    run_ppi_batch, plus:
+
+    Parameters
+    ----------
+        seed: int, numpy SeedSequence or numpy Generator, optional
+            The seed from which the generator of each chunk of replicas is
+            spawned. If not given, fresh entropy is used.
+        processes: int, optional
+            The number of processes (or threads).
+        chunk_size: int, optional
+            The number of replicas simulated in each task. Given a seed, the
+            results depend on the size of the chunks but not on the number of
+            processes.
+        backend: str, optional
+            'process', 'thread' or 'serial' (see ParallelRunner).
+
+    Returns
+    -------
+        The same outputs as run_ppi_batch.
+    """
+    with ParallelRunner(I0, T, A, alpha, phi, tau, R, gov_func, PF, pf, tolerance,
+                        sparse, processes=processes, backend=backend) as runner:
+        return runner.run(n_replicas, P0=P0, H0=H0, outputs=outputs, seed=seed,
+                          chunk_size=chunk_size)
@@ -12,10 +12,22 @@ Acknowledgments: This product was developed through the sponsorship of the
 This file contains all the necesary functions to reproduce the analysis presented
 in the methodological and technical reports. The accompanying data can be 
 obtained from the public repository: https://github.com/oguerrer/PPI4SD. 
-There are two functions in this script:
+There are eight functions and three classes in this script:
     
     run_ppi: the main function that simulates the policymaking process and
     generates synthetic development-indicator data.
+    run_ppi_batch: a version of run_ppi that simulates several independent
+    replicas at once.
+    PPIModel: a class that validates and prepares the inputs of the model once,
+    so it can be simulated many times (run_ppi_batch is built on it).
+    prepare_network: a support function to prepare the spillover network,
+    either as a dense or as a sparse matrix.
+    get_rng, fill_uniform, spawn_seeds and child_seed: support functions to 
+    handle random number generators and their seeds.
+    UniformBlock: a support class that draws the random numbers of many 
+    periods at once.
+    PhaseProfile: a support class that measures the time (and optionally the
+    memory) spent in each phase of run_ppi.
     get_targets: a support function to transform a collection of series 
     where one or more targets are less or equals to the initial value of the series.
 
@@ -36,6 +48,8 @@ passed as explained in the function run_ppi.
 Rquired external libraries
 --------------------------
 - Numpy
+- Scipy (optional): used to compute the spillovers through sparse matrices 
+            when the network has few edges.
 
 
 """
@@ -44,12 +58,36 @@ Rquired external libraries
 from __future__ import division, print_function
 import numpy as np
 import copy
+import time
+import pickle
+import tracemalloc
 import warnings
 warnings.simplefilter("ignore")
 
+try:
+    import scipy.sparse as sp
+except ImportError:
+    sp = None
+
+# networks with a lower share of non-zero entries are handled as sparse matrices
+SPARSE_DENSITY = .05
+
+# networks with at most this many indicators are handled as dense matrices by
+# PPIModel (unless 'sparse' is given), since dense products can be computed in place
+DENSE_SIZE = 256
+
+# minimum number of uniform random numbers drawn at once from a Generator
+UNIFORM_BLOCK = 2**14
+
+# views of the workspace of a PPIState used by PPIModel.step (in the order in which it unpacks them)
+STEP_VIEWS = ('dI', 'gaps', 'cnorm', 'S', 'NK1', 'NK2', 'NKb', 'dIns', 'C', 'D', 'sign', 'changeF', 
+              'nk1', 'nk2', 'nkb', 'nkf', 'k1', 'k2', 'k3', 'k1b', 'kb', 'U1', 'U2', 'U2p', 'U3', 
+              'dIr', 'gapsr', 'cnormr', 'kbc')
+
 
 def run_ppi(I0, T, A=None, alpha=.1, phi=.5, tau=.5, R=None, 
-            gov_func=None, P0=None, H0=None, PF=None, pf=1, tolerance=1e-3):
+            gov_func=None, P0=None, H0=None, PF=None, pf=1, tolerance=1e-3, outputs='all', sparse=None,
+            seed=None, profile=None, horizon=None):
     """Function to run one simulation of the Policy Priority Inference model.
 
     Parameters
@@ -62,7 +100,7 @@ def run_ppi(I0, T, A=None, alpha=.1, phi=.5, tau=.5, R=None,
             it is usually assumed that the targets correspond to the final values 
             of the series. They should be higher than I0 or the model will not 
             converge.
-        A:  2D numpy array
+        A:  2D numpy array or scipy sparse matrix
             The adjacency matrix of the spillover network of development 
             indicators. If not given, the model assumes a zero-matrix, so there 
             are no spillovers.
@@ -93,9 +131,34 @@ def run_ppi(I0, T, A=None, alpha=.1, phi=.5, tau=.5, R=None,
             The precision to consider that an indicator has reached its goal.
             Unless you understand very well how PPI works, this should not be
             changed.
+        outputs: str, optional
+            The outputs to be recorded and returned: 'all' (every time series), 
+            'indicators' (only the time series of the indicators), 'final' (only 
+            the final indicators and allocations) or 'ticks' (only the convergence 
+            times). Recording less makes each simulation cheaper.
+        sparse: bool, optional
+            Whether to compute the spillovers through a sparse representation 
+            of A. If not given, it is chosen automatically from the density of A.
+        seed: int, numpy SeedSequence or numpy Generator, optional
+            The seed of the random number generator. If not given, the random 
+            numbers are drawn from the global generator of numpy (np.random).
+        profile: PhaseProfile, optional
+            An object that measures the time spent in each phase of the 
+            simulation (see PhaseProfile). If not given, nothing is measured.
+        horizon: int, optional
+            A fixed number of periods to be simulated, e.g. for a prospective 
+            analysis. The simulation runs exactly 'horizon' periods, whether
+            the indicators reach their targets before or not, and the time 
+            series are preallocated with one column per period. If not given, 
+            the simulation runs until all the indicators reach their targets.
         
     Returns
     -------
+        The outputs below are returned when outputs='all'. With outputs='indicators'
+        the function returns tsI, ticks and H; with outputs='final' it returns
+        I, P, ticks and H, where I and P are the final vectors of indicators and 
+        allocations; and with outputs='ticks' it only returns ticks.
+        
         tsI: 2D numpy array
             Matrix with the time series of the simulated indicators. Each column 
             corresponds to a simulation step.
@@ -116,6 +179,8 @@ def run_ppi(I0, T, A=None, alpha=.1, phi=.5, tau=.5, R=None,
             corresponds to a simulation step.
         ticks: numpy array
             A vector with the simulation step in which each indicator reached its target.
+            With a fixed horizon, it is NaN for the indicators that did not reach
+            their targets.
         H: numpy array
             A vector with historical inefficiencies,
     """
@@ -128,36 +193,54 @@ def run_ppi(I0, T, A=None, alpha=.1, phi=.5, tau=.5, R=None,
     else:
         R = R.astype(bool)
     
-    # if no network is provided, create a zero-matrix
-    if A is None:
-        A = np.zeros((N,N))
-    else:
-        A = copy.deepcopy(A)
-        np.fill_diagonal(A, 0)
+    # prepare the network for the computation of spillovers
+    At = prepare_network(A, N, sparse)
     
+    rng = get_rng(seed) # random number generator
     n = np.sum(R) # number of instrumental nodes
+    uniforms = UniformBlock(rng) # random numbers of the periods, drawn in blocks
+    
+    if outputs not in ('all', 'indicators', 'final', 'ticks'):
+        raise ValueError("outputs must be 'all', 'indicators', 'final' or 'ticks'")
+    rec_all = outputs == 'all' # flag to record all the time series
+    rec_ind = outputs in ('all', 'indicators') # flag to record the indicators
     
     tsI = [] # stores time series of indicators
     tsC = [] # stores time series of contributions
     tsF = [] # stores time series of benefits
     tsP = [] # stores time series of allocations
     tsD = [] # stores time series of corruption
-    tsX = [] # stores time series of actions
     tsS = [] # stores time series of spillovers
     
+    # with a fixed horizon, the time series are preallocated (one row per period)
+    horizon = check_horizon(horizon)
+    if horizon is not None:
+        if rec_ind:
+            tsI = np.zeros((horizon, N))
+        if rec_all:
+            tsC, tsF, tsP, tsD = [np.zeros((horizon, n)) for i in range(4)]
+            tsS = np.zeros((horizon, N))
+    
+    def store(series, values):
+        """Stores the values of this period in a time series."""
+        if horizon is None:
+            series.append(copy.deepcopy(values))
+        else:
+            series[step-2] = values
+    
     qs = np.ones(n) # propensities to allocate resources (initially homogeneous)
-    pp = np.random.rand(n) # random initial allocation profile
+    pp = rng.random(n) # random initial allocation profile
     P = pp/np.sum(pp) # vector of allocations (initially homogeneous)
-    C = np.random.rand(n)*P # vector of contributions
-    F = np.random.rand(n) # vector of benefits
-    Ft = np.random.rand(n) # vectors of lagged benefits
+    C = rng.random(n)*P # vector of contributions
+    F = rng.random(n) # vector of benefits
+    Ft = rng.random(n) # vectors of lagged benefits
     I = copy.deepcopy(I0) # vector of indicators
-    It = np.random.rand(N)*I0 # vector of lagged indicators
-    X = np.random.rand(n)-.5 # vector of actions
-    Xt = np.random.rand(n)-.5 # vector of lagged actions
-    H = 1 + np.random.rand(n) # vector of historical inefficiencies
-    signt = np.sign(np.random.rand(n)-.5) # vector of previous signs for directed learning
-    changeFt = np.random.rand(n)-.5 # vector of changes in benefits
+    It = rng.random(N)*I0 # vector of lagged indicators
+    X = rng.random(n)-.5 # vector of actions
+    Xt = rng.random(n)-.5 # vector of lagged actions
+    H = 1 + rng.random(n) # vector of historical inefficiencies
+    signt = np.sign(rng.random(n)-.5) # vector of previous signs for directed learning
+    changeFt = rng.random(n)-.5 # vector of changes in benefits
     gaps0 = T-I0 # initial target-indicator gaps
     
     step = 1 # iteration counter
@@ -169,12 +252,18 @@ def run_ppi(I0, T, A=None, alpha=.1, phi=.5, tau=.5, R=None,
     if H0 is not None:
         H = H0
     
+    timed = profile is not None # flag to measure the phases
+    if timed:
+        profile.start()
+    
     finish = False # a flag to halt the simulation (activates when all indicators reach their targets)
     while not finish: # iterate until the flag indicates otherwise
         
         step += 1 # increase counter
-        tsI.append(copy.deepcopy(I)) # store this period's indicators
-        tsP.append(copy.deepcopy(P)) # store this period's allocations
+        if rec_ind:
+            store(tsI, I) # store this period's indicators
+        if rec_all:
+            store(tsP, P) # store this period's allocations
 
         deltaIAbs = I-It # change of all indicators
         deltaIIns = deltaIAbs[R] # change of instrumental indicators
@@ -199,38 +288,49 @@ def run_ppi(I0, T, A=None, alpha=.1, phi=.5, tau=.5, R=None,
         signt = copy.deepcopy(sign) # update previous signs
         changeFt = copy.deepcopy(changeF) # update previous changes in benefits
         
-        tsC.append(copy.deepcopy(C)) # store this period's contributions
-        tsD.append(copy.deepcopy(P-C)) # store this period's inefficiencies
-        tsF.append(copy.deepcopy(F)) # store this period's benefits
-        tsX.append(copy.deepcopy(X)) # store this period's actions
+        if rec_all:
+            store(tsC, C) # store this period's contributions
+            store(tsD, P-C) # store this period's inefficiencies
+            store(tsF, F) # store this period's benefits
+        if timed: profile.lap('contributions')
         
         
         ### DETERMINE BENEFITS ###
         
         D = P-C # update inefficiencies
         pp = 1/(1 + np.exp(-(D-D.min())/(D.max()-D.min()) - .5)) # social norm factor
-        trial = (np.random.rand(n) < phi * pp) # monitoring outcomes
+        if timed: profile.lap('benefits')
+        draws = uniforms.take(n) # random numbers of the monitoring
+        if timed: profile.lap('random')
+        trial = (draws < phi * pp) # monitoring outcomes
         theta = trial.astype(float) # indicator function of uncovering inefficiencies
         H[theta==1] += P[theta==1] - C[theta==1] # accumulate spotted inefficiencies
         newF = deltaIIns*C/P + (1-theta*tau)*(P-C)/P # compute benefits
         Ft = copy.deepcopy(F) # update lagged benefits
         F = newF # update benefits
+        if timed: profile.lap('benefits')
         
         
         ### DETERMINE INDICATORS ###
         
         cnorm = np.zeros(N) # initialize a zero-vector to store the normalized contributions
         cnorm[R] = C/P.max() # compute normalized contributions only for instrumental nodes
+        if timed: profile.lap('indicators')
         
-        deltaM = np.array([deltaIAbs,]*len(deltaIAbs)).T # reshape deltaIAbs into a matrix
-        S = np.sum(deltaM*A, axis=0) # compute spillovers
-        tsS.append(S) # save spillovers
+        S = At.dot(deltaIAbs) # compute spillovers
+        if timed: profile.lap('spillovers')
+        if rec_all:
+            store(tsS, S) # save spillovers
         gaps = T-I # current target-indicator gaps
         gammas = (alpha + cnorm)/(alpha + np.exp(-S/(np.mean(gaps/gaps0)))) # compute probability of succesful growth
-        succsess = (np.random.rand(N) < gammas).astype(int) # determine if there is succesful growrth
+        if timed: profile.lap('indicators')
+        draws = uniforms.take(N) # random numbers of the growth process
+        if timed: profile.lap('random')
+        succsess = (draws < gammas).astype(int) # determine if there is succesful growrth
         newI = I + (T-I) * alpha * succsess # compute new indicators
         It = copy.deepcopy(I) # update lagged indicators
         I =  copy.deepcopy(newI) # update indicators
+        if timed: profile.lap('indicators')
         
         
         ### DETERMINE ALLOCATIONS ###
@@ -248,7 +348,9 @@ def run_ppi(I0, T, A=None, alpha=.1, phi=.5, tau=.5, R=None,
         
         # compute policy priorities (with default function or user-given one)
         if gov_func is not None:
+            if timed: profile.lap('allocations')
             qs = gov_func(gap, hist) # determine propensities with user-given function
+            if timed: profile.lap('gov_func')
         else: 
             qs = (gap**(1+hist)) / np.sum(gap**(1+hist))
         
@@ -256,7 +358,7 @@ def run_ppi(I0, T, A=None, alpha=.1, phi=.5, tau=.5, R=None,
         if PF is None:
             P = qs/np.sum(qs) # normalize priorities
         else:
-            if np.random.rand() < pf:
+            if uniforms.take(1)[0] < pf:
                 P = PF/np.sum(PF) # use exogenous policy priorities
             else:
                 P = qs/np.sum(qs) # use endogenous policy priorities
@@ -265,16 +367,1194 @@ def run_ppi(I0, T, A=None, alpha=.1, phi=.5, tau=.5, R=None,
         converged = np.abs(T-I) < tolerance
         ticks[~converged] = step
         
-        # check if all indicators have converged
-        if converged.sum() == N:
+        # check if all indicators have converged (or if the horizon was reached)
+        if horizon is None and converged.sum() == N:
+            finish = True
+        elif horizon is not None and step > horizon:
             finish = True
+        if timed: profile.lap('allocations', step=True)
+    
+    if timed:
+        profile.stop()
+    
+    if horizon is not None:
+        ticks[~converged] = np.nan # indicators that did not reach their targets
+    
+    if outputs == 'ticks':
+        return ticks
+    elif outputs == 'final':
+        return I, P, ticks, H
+    elif outputs == 'indicators':
+        return np.asarray(tsI).T, ticks, H
+    return np.asarray(tsI).T, np.asarray(tsC).T, np.asarray(tsF).T, np.asarray(tsP).T, np.asarray(tsD).T, np.asarray(tsS).T, ticks, H
+
+
+
+def run_ppi_batch(I0, T, A=None, alpha=.1, phi=.5, tau=.5, R=None, 
+            gov_func=None, P0=None, H0=None, PF=None, pf=1, tolerance=1e-3,
+            n_replicas=100, outputs='all', sparse=None, seed=None, horizon=None):
+    """Function to run several independent simulations of the Policy Priority 
+    Inference model at once.
+    
+    The replicas are advanced together as matrices in which each row corresponds 
+    to one replica, so the overhead of the Python interpreter is paid once per 
+    step instead of once per step and replica. A replica stops being updated as
+    soon as all its indicators reach their targets. Each replica follows the 
+    same dynamics as run_ppi, but the random numbers are drawn in a different 
+    order, so the results are equivalent in distribution and not number by number.
+
+    Parameters
+    ----------
+        I0: numpy array 
+            Initial values of the development indicators.
+        T: numpy array 
+            Target values for development indicators. These values represent 
+            the government's goals or aspirations. For a retrospective analysis, 
+            it is usually assumed that the targets correspond to the final values 
+            of the series. They should be higher than I0 or the model will not 
+            converge.
+        A:  2D numpy array or scipy sparse matrix
+            The adjacency matrix of the spillover network of development 
+            indicators. If not given, the model assumes a zero-matrix, so there 
+            are no spillovers.
+        alpha: float, optional
+            A vector of growth factors in (0,1).
+        phi: float, optional
+            Scalar in [0,1] or numpy array (a vector) with values in [0,1] that 
+            represent the quality of the government's monitoring mechanisms.
+        tau: float, optional 
+            Scalar in [0,1] or numpy array (a vector) with values in [0,1] that 
+            represent the quality of the rule of law.
+        R: numpy array, optional
+            Binary vector indicating which nodes are instrumental (value 1) and 
+            which are not (value 0). If not provided, it is assumed that all
+            nodes are instrumental (a vector of ones).
+        gov_func: python function, optional
+            A custom function that that returns the policy priority of the governemnt.
+            It is called once per replica with the same arguments as in run_ppi.
+        P0: numpy array, optional
+            An array with the initial allocation profile.
+        H0: numpy array, optional
+            The initial vector of historical inefficiencies
+        PF: numpy array, optional
+            An exogenous vector of policy priorities.
+        pf: float, optional
+            The probability with which the exogenous priorities are followed
+            each period. It must be in [0,1].
+        tolerance: float, optional
+            The precision to consider that an indicator has reached its goal.
+            Unless you understand very well how PPI works, this should not be
+            changed.
+        n_replicas: int, optional
+            The number of simulations to be performed.
+        outputs: str, optional
+            The outputs to be recorded and returned: 'all' (every time series), 
+            'indicators' (only the time series of the indicators), 'final' (only 
+            the final indicators and allocations) or 'ticks' (only the convergence 
+            times). Recording less makes each simulation cheaper.
+        sparse: bool, optional
+            Whether to compute the spillovers through a sparse representation 
+            of A. If not given, it is chosen automatically from the density of A.
+        seed: int, numpy SeedSequence or numpy Generator, optional
+            The seed of the random number generator. If not given, the random 
+            numbers are drawn from the global generator of numpy (np.random).
+        horizon: int, optional
+            A fixed number of periods to be simulated (see run_ppi). All the 
+            replicas are simulated for the same number of periods, so all their
+            time series have the same shape.
+        
+    Returns
+    -------
+        The outputs below are returned when outputs='all'. The other options
+        return the same subsets as in run_ppi, where the final indicators and
+        allocations are matrices with one row per replica.
+        
+        tsI: list
+            A list with one matrix per replica. Each matrix has the same format 
+            as the output tsI of run_ppi.
+        tsC: list
+            A list with one matrix per replica. Each matrix has the same format 
+            as the output tsC of run_ppi.
+        tsF: list
+            A list with one matrix per replica. Each matrix has the same format 
+            as the output tsF of run_ppi.
+        tsP: list
+            A list with one matrix per replica. Each matrix has the same format 
+            as the output tsP of run_ppi.
+        tsD: list
+            A list with one matrix per replica. Each matrix has the same format 
+            as the output tsD of run_ppi.
+        tsS: list
+            A list with one matrix per replica. Each matrix has the same format 
+            as the output tsS of run_ppi.
+        ticks: 2D numpy array
+            A matrix with the simulation step in which each indicator reached 
+            its target. Each row corresponds to a replica.
+        H: 2D numpy array
+            A matrix with historical inefficiencies. Each row corresponds to a 
+            replica.
+    """
+    
+    model = PPIModel(I0, T, A=A, alpha=alpha, phi=phi, tau=tau, R=R, gov_func=gov_func, 
+                     PF=PF, pf=pf, tolerance=tolerance, sparse=sparse)
+    return model.run_many(n_replicas, P0=P0, H0=H0, outputs=outputs, seed=seed, horizon=horizon)
+
+
+
+class PPIState(object):
+    """Container with the state of one or more replicas of the model. It is
+    created by PPIModel.init_state and advanced by PPIModel.step. The matrices
+    of the agents' states have one row per active replica, and the replica 
+    to which each row corresponds is given by 'ids'. Once all the indicators
+    of a replica reach their targets, its row is removed and its final values 
+    are kept in 'ticks', 'I_final', 'P_final' and 'H_final'. The convergence
+    ticks of the active replicas are kept in 'tick_rows'. With a fixed horizon,
+    the replicas are only removed once the horizon is reached, and the ticks of
+    the indicators that did not reach their targets are NaN.
+    
+    The state also holds a workspace of preallocated buffers that PPIModel.step
+    uses to avoid creating temporary arrays. Since the lagged states are 
+    updated by swapping buffers, the arrays of the state are overwritten in 
+    the following steps and should be copied if they need to be kept. The 
+    columns of the indicators of the active replicas ('I', 'It', 'tick_rows' 
+    and the spillovers 'S') follow the internal order of the model, in which
+    the instrumental indicators come first (see PPIModel.order), while the
+    final values ('ticks' and 'I_final') follow the original order.
+    
+    A state can be copied (copy and fork), saved to a file and loaded back 
+    (save and load) together with its random number generator, so simulations
+    can branch from a common history (e.g. to compare several budgets) or be 
+    resumed later with PPIModel.step or PPIModel.run_many. The global generator
+    of numpy (np.random) cannot be copied, so the copies of a state that uses it
+    keep drawing from the global generator.
+    """
+    
+    def __init__(self, K, N, n, dtype=np.float64):
+        self.K = K # number of replicas
+        self.step = 1 # iteration counter
+        self.ids = np.arange(K) # replica to which each row of the state matrices corresponds
+        self.ticks = np.ones((K, N)) # simulation period in which each indicator reaches its target
+        self.tick_rows = np.ones((K, N)) # convergence ticks of the active replicas
+        self.lengths = np.zeros(K, dtype=int) # number of simulated periods of each replica
+        self.I_final = np.zeros((K, N), dtype=dtype) # final indicators of each replica
+        self.P_final = np.zeros((K, n), dtype=dtype) # final allocations of each replica
+        self.H_final = np.zeros((K, n), dtype=dtype) # final historical inefficiencies of each replica
+        self.finish = np.zeros(K, dtype=bool) # replicas that converged in the last step
+        self.rows = K # number of rows updated in the last step
+        self.rng = np.random # random number generator
+        self.horizon = None # fixed number of periods to be simulated (if any)
+        self.uniforms = UniformBlock(np.random) # uniform random numbers of the steps
+        
+        # workspace with buffers for the intermediate results of each step
+        self.work = dict(
+            (name, np.zeros((K, N), dtype=dtype)) for name in ('dI', 'gaps', 'cnorm', 'S', 'NK1', 'NK2'))
+        self.work.update(
+            (name, np.zeros((K, n), dtype=dtype)) for name in ('dIns', 'C', 'D', 'sign', 'changeF', 'nk1', 'nk2', 'nkf'))
+        self.work.update(
+            (name, np.zeros((K, 1), dtype=dtype)) for name in ('k1', 'k2', 'k3'))
+        self.work['U1'] = np.zeros((K, n)) # buffers for random numbers
+        self.work['U2'] = np.zeros((K, N))
+        self.work['U2p'] = np.zeros((K, N)) # the numbers of U2 in the internal order of the indicators
+        self.work['U3'] = np.zeros(K)
+        self.work['NKb'] = np.zeros((K, N), dtype=bool)
+        self.work['nkb'] = np.zeros((K, n), dtype=bool)
+        self.work['k1b'] = np.zeros((K, 1), dtype=bool)
+        self.work['kb'] = np.zeros(K, dtype=bool)
+        self.views = None # views of the workspace for the active replicas (see PPIModel.step)
+    
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if not isinstance(self.rng, np.random.Generator):
+            state['rng'] = None # the global generator of numpy is not copied
+        state['views'] = None # the views are created again on top of the copied workspace
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.views = None
+        if self.rng is None:
+            self.rng = np.random
+    
+    def copy(self):
+        """Returns an independent copy of the state, including its random number
+        generator, so the copy evolves exactly as the original would."""
+        return copy.deepcopy(self)
+    
+    def fork(self, seed=None):
+        """Returns a copy of the state that can be advanced separately, e.g. with
+        another PPIModel with the same indicators (but other PF or pf) or after
+        modifying its allocations 'P'.
+
+        Parameters
+        ----------
+            seed: int, numpy SeedSequence or numpy Generator, optional
+                The seed of a new random number generator for the fork. If not 
+                given, the fork continues the random numbers of the original, so
+                the differences between both are only due to the changes made
+                to the fork (common random numbers).
+            
+        Returns
+        -------
+            state: PPIState
+                The fork.
+        """
+        state = self.copy()
+        if seed is not None:
+            state.rng = get_rng(seed)
+            state.uniforms = UniformBlock(state.rng, len(state.uniforms.buffer))
+        return state
+    
+    def save(self, path):
+        """Saves the state (with its random number generator) to a file."""
+        with open(path, 'wb') as file:
+            pickle.dump(self, file, protocol=pickle.HIGHEST_PROTOCOL)
+    
+    @staticmethod
+    def load(path):
+        """Loads a state saved with PPIState.save."""
+        with open(path, 'rb') as file:
+            state = pickle.load(file)
+        if not isinstance(state, PPIState):
+            raise ValueError('the file does not contain a PPIState')
+        return state
+    
+    @property
+    def active(self):
+        """Number of replicas that have not converged."""
+        return len(self.ids) - np.count_nonzero(self.finish)
+    
+    @property
+    def C(self):
+        """Contributions of the last step."""
+        return self.work['C'][0:self.rows]
+    
+    @property
+    def S(self):
+        """Spillovers of the last step (in the internal order of the indicators)."""
+        return self.work['S'][0:self.rows]
+
+
+
+class PPIModel(object):
+    """A Policy Priority Inference model with fixed inputs.
+    
+    The inputs are validated and converted only once, when the model is created,
+    so the model can be simulated many times without repeating this work. The 
+    simulations follow the same dynamics as run_ppi, and several replicas are 
+    advanced at once as matrices in which each row corresponds to one replica.
+
+    Parameters
+    ----------
+        I0: numpy array 
+            Initial values of the development indicators.
+        T: numpy array 
+            Target values for development indicators. They should be higher 
+            than I0 or the model will not converge.
+        A:  2D numpy array or scipy sparse matrix, optional
+            The adjacency matrix of the spillover network of development 
+            indicators. If not given, the model assumes a zero-matrix, so there 
+            are no spillovers.
+        alpha: float, optional
+            A vector of growth factors in (0,1).
+        phi: float, optional
+            Scalar in [0,1] or numpy array (a vector) with values in [0,1] that 
+            represent the quality of the government's monitoring mechanisms.
+        tau: float, optional 
+            Scalar in [0,1] or numpy array (a vector) with values in [0,1] that 
+            represent the quality of the rule of law.
+        R: numpy array, optional
+            Binary vector indicating which nodes are instrumental (value 1) and 
+            which are not (value 0). If not provided, it is assumed that all
+            nodes are instrumental (a vector of ones).
+        gov_func: python function, optional
+            A custom function that that returns the policy priority of the governemnt.
+            It is called once per replica with the same arguments as in run_ppi.
+        PF: numpy array, optional
+            An exogenous vector of policy priorities.
+        pf: float, optional
+            The probability with which the exogenous priorities are followed
+            each period. It must be in [0,1].
+        tolerance: float, optional
+            The precision to consider that an indicator has reached its goal.
+        sparse: bool, optional
+            Whether to compute the spillovers through a sparse representation 
+            of A. If not given, it is chosen automatically from the density of A,
+            except for networks of at most DENSE_SIZE indicators, which are
+            always dense so their products are computed in place.
+        dtype: numpy dtype, optional
+            The floating point type of the simulation, e.g. np.float32 to halve
+            the memory of large batches.
+    """
+    
+    def __init__(self, I0, T, A=None, alpha=.1, phi=.5, tau=.5, R=None, 
+                 gov_func=None, PF=None, pf=1, tolerance=1e-3, sparse=None,
+                 dtype=np.float64):
+        
+        self.dtype = np.dtype(dtype)
+        self.I0 = np.array(I0, dtype=self.dtype)
+        self.T = np.array(T, dtype=self.dtype)
+        if self.I0.ndim != 1 or self.I0.shape != self.T.shape:
+            raise ValueError('I0 and T must be vectors of the same length')
+        N = len(self.I0) # number of indicators
+        
+        # transform indicators of instrumental variables into boolean types
+        if R is None:
+            R = np.ones(N).astype(bool)
+        else:
+            R = np.asarray(R).astype(bool)
+            if R.shape != (N,):
+                raise ValueError('R must have one element per indicator')
+        n = np.sum(R) # number of instrumental nodes
+        
+        self.alpha = self._param(alpha, (N,), 'alpha')
+        if np.any(self.alpha <= 0) or np.any(self.alpha >= 1):
+            raise ValueError('alpha must be in (0,1)')
+        self.phi = self._param(phi, (n,), 'phi')
+        self.tau = self._param(tau, (n,), 'tau')
+        if PF is not None:
+            PF = self._param(PF, (n,), 'PF')
+            PF = PF/PF.sum()
+        if not 0 <= pf <= 1:
+            raise ValueError('pf must be in [0,1]')
+        
+        self.N = N
+        self.n = n
+        self.R = R
+        
+        # the indicators are reordered so the instrumental ones come first and 
+        # their values are contiguous blocks of the matrices of the step
+        self.order = np.concatenate((np.where(R)[0], np.where(~R)[0])) # internal order of the indicators
+        self.unorder = np.argsort(self.order) # original order of the indicators
+        self.reordered = bool(np.any(self.order != np.arange(N)))
+        
+        # numpy buffers the operands of the operations that it cannot iterate as 
+        # a single vector (e.g. a matrix and a column) in blocks of 8,192 values
+        # by default, which are allocated in each operation. The steps use blocks
+        # no longer than the rows of the matrices, which need no buffers
+        self.bufsize = max(16, n//16*16)
+        self.I0 = self._internal(self.I0)
+        self.T = self._internal(self.T)
+        self.alpha = self._internal(self.alpha)
+        if sparse is None and N <= DENSE_SIZE:
+            sparse = False
+        At = prepare_network(A, N, sparse).astype(self.dtype)
+        self.At = At[self.order][:,self.order] # transposed network
+        self.At_dense = None if sp is not None and sp.issparse(self.At) else self.At.T # network for dense products
+        self.gov_func = gov_func
+        self.PF = PF
+        self.pf = pf
+        self.tolerance = tolerance
+        self.gaps0 = self.T-self.I0 # initial target-indicator gaps
+    
+    
+    def _internal(self, values):
+        """Reorders a vector (or the columns of a matrix) of the indicators into
+        the internal order of the model. Scalars are returned as they are."""
+        values = np.asarray(values)
+        if values.ndim == 0:
+            return values
+        return np.take(values, self.order, axis=-1)
+    
+    
+    def _external(self, values):
+        """Reorders a vector (or the columns of a matrix) of the indicators from
+        the internal order of the model into the original one."""
+        return np.take(values, self.unorder, axis=-1)
+    
+    
+    def _param(self, value, shape, name):
+        """Converts a parameter into a scalar or a vector of the model's dtype."""
+        value = np.array(value, dtype=self.dtype)
+        if value.ndim != 0 and value.shape != shape:
+            raise ValueError('%s must be a scalar or a vector with %i elements' % (name, shape[0]))
+        return value
+    
+    
+    def init_state(self, n_replicas=1, P0=None, H0=None, seed=None, horizon=None):
+        """Creates the initial state of a set of replicas.
+
+        Parameters
+        ----------
+            n_replicas: int, optional
+                The number of replicas.
+            P0: numpy array, optional
+                An array with the initial allocation profile.
+            H0: numpy array, optional
+                The initial vector of historical inefficiencies.
+            seed: int, numpy SeedSequence or numpy Generator, optional
+                The seed of the random number generator of the replicas. If not
+                given, the global generator of numpy (np.random) is used.
+            horizon: int, optional
+                A fixed number of periods to be simulated (see run_ppi). If not 
+                given, each replica is simulated until it converges.
+            
+        Returns
+        -------
+            state: PPIState
+                The initial state of the replicas.
+        """
+        horizon = check_horizon(horizon)
+        K, N, n = n_replicas, self.N, self.n
+        dtype = self.dtype
+        state = PPIState(K, N, n, dtype)
+        state.horizon = horizon
+        state.rng = rng = get_rng(seed)
+        state.uniforms = UniformBlock(rng, K*(N+n+1))
+        
+        pp = rng.random((K, n)) # random initial allocation profiles
+        state.P = (pp/pp.sum(axis=1, keepdims=True)).astype(dtype) # matrix of allocations
+        state.F = rng.random((K, n)).astype(dtype) # matrix of benefits
+        state.Ft = rng.random((K, n)).astype(dtype) # matrix of lagged benefits
+        state.I = np.tile(self.I0, (K,1)) # matrix of indicators
+        state.It = (self._internal(rng.random((K, N)))*self.I0).astype(dtype) # matrix of lagged indicators
+        state.X = (rng.random((K, n))-.5).astype(dtype) # matrix of actions
+        state.Xt = (rng.random((K, n))-.5).astype(dtype) # matrix of lagged actions
+        state.H = (1 + rng.random((K, n))).astype(dtype) # matrix of historical inefficiencies
+        state.signt = np.sign(rng.random((K, n))-.5).astype(dtype) # matrix of previous signs for directed learning
+        state.changeFt = (rng.random((K, n))-.5).astype(dtype) # matrix of changes in benefits
+        
+        # in case the user provides initial allocation or historical inefficiencies
+        if P0 is not None:
+            state.P = np.tile(P0/P0.sum(), (K,1)).astype(dtype)
+        if H0 is not None:
+            state.H = np.tile(H0, (K,1)).astype(dtype)
+        
+        return state
+    
+    
+    def _remove_finished(self, state):
+        """Removes from the state matrices the replicas that converged in the
+        last step and stores their final values."""
+        finish = state.finish
+        if not finish.any():
+            return
+        done = state.ids[finish]
+        state.lengths[done] = state.step-1
+        state.ticks[done] = self._external(state.tick_rows[finish])
+        if state.horizon is not None:
+            ticks = state.ticks[done]
+            ticks[ticks == state.step] = np.nan # indicators that did not reach their targets
+            state.ticks[done] = ticks
+        state.I_final[done] = self._external(state.I[finish])
+        state.P_final[done] = state.P[finish]
+        state.H_final[done] = state.H[finish]
+        keep = ~finish
+        state.ids = state.ids[keep]
+        for name in ('I', 'It', 'P', 'F', 'Ft', 'X', 'Xt', 'H', 'signt', 'changeFt', 'tick_rows'):
+            setattr(state, name, getattr(state, name)[keep])
+        state.finish = state.finish[keep]
+    
+    
+    def _views(self, state):
+        """Returns the views of the workspace buffers for the active replicas of
+        a state. They are kept in the state until the number of active replicas
+        changes, so a step does not create them again."""
+        k = len(state.ids)
+        if state.views is None or state.views[0] != k:
+            n = self.n
+            views = dict((name, buffer[0:k]) for name, buffer in state.work.items())
+            views['dIr'], views['gapsr'], views['cnormr'] = [views[name][:,0:n] for name in ('dI', 'gaps', 'cnorm')] # blocks of the instrumental nodes
+            views['kbc'] = views['kb'][:,None]
+            state.views = (k, tuple(views[name] for name in STEP_VIEWS))
+        return state.views[1]
+    
+    
+    def step(self, state):
+        """Advances all the active replicas of a state by one period.
+        
+        All the operations are computed in place on the buffers of the state's 
+        workspace, whose views are reused while the number of active replicas 
+        does not change, and the lagged states are updated by swapping buffers,
+        so a step does not create new arrays (except for the random numbers when 
+        the global generator of numpy is used and, when the network is sparse, 
+        the spillovers). With a Generator, the random numbers of many steps are
+        drawn at once (see UniformBlock). Since the instrumental indicators come
+        first in the internal order, their values are blocks of the matrices of
+        all the indicators.
+
+        Parameters
+        ----------
+            state: PPIState
+                The state to be updated. It is modified in place.
             
+        Returns
+        -------
+            active: int
+                The number of replicas that have not converged after this step.
+        """
+        bufsize = np.setbufsize(self.bufsize)
+        try:
+            return self._step(state)
+        finally:
+            np.setbufsize(bufsize)
+    
+    
+    def _step(self, state):
+        """Advances the replicas of a state by one period (see step)."""
+        self._remove_finished(state)
+        
+        n = self.n
+        T, alpha, phi, tau = self.T, self.alpha, self.phi, self.tau
+        I, It, P, F, Ft = state.I, state.It, state.P, state.F, state.Ft
+        X, Xt, H = state.X, state.Xt, state.H
+        k = len(state.ids) # number of active replicas
+        state.step += 1 # increase counter
+        state.rows = k
+        
+        # views of the workspace buffers for the active replicas
+        (dI, gaps, cnorm, S, NK1, NK2, NKb, dIns, C, D, sign, changeF, nk1, nk2, nkb, nkf,
+         k1, k2, k3, k1b, kb, U1, U2, U2p, U3, dIr, gapsr, cnormr, kbc) = self._views(state)
+        
+        np.subtract(I, It, out=dI) # change of all indicators (the instrumental ones in dIr)
+        
+        # relative change of instrumental indicators
+        np.sum(dIr, axis=1, keepdims=True, out=k1)
+        np.equal(k1, 0, out=k1b)
+        np.abs(dIr, out=nk1)
+        np.sum(nk1, axis=1, keepdims=True, out=k2)
+        np.copyto(k2, np.inf, where=k1b) # the relative change is zero if the changes add up to zero
+        np.divide(dIr, k2, out=dIns)
+        
+        
+        ### DETERMINE CONTRIBUTIONS ###
+        
+        np.subtract(F, Ft, out=changeF) # absolute change in benefits
+        np.subtract(X, Xt, out=nk1) # absolute change in actions
+        np.multiply(changeF, nk1, out=sign)
+        np.sign(sign, out=sign) # sign for the direction of the next action
+        np.equal(changeF, 0, out=nkb)
+        np.copyto(changeF, state.changeFt, where=nkb) # if the benefit did not change, keep the last change
+        np.equal(sign, 0, out=nkb)
+        np.copyto(sign, state.signt, where=nkb) # if the sign is undefined, keep the last one
+        np.abs(changeF, out=nk1)
+        np.multiply(sign, nk1, out=nk1)
+        np.add(X, nk1, out=Xt) # determine current action (in the buffer of the lagged actions)
+        X, Xt = Xt, X # update lagged actions
+        np.negative(X, out=C)
+        np.exp(C, out=C)
+        np.add(C, 1, out=C)
+        np.divide(P, C, out=C) # map action into contribution
+        
+        # update previous signs and changes in benefits
+        np.copyto(state.signt, sign)
+        np.copyto(state.changeFt, changeF)
+        
+        
+        ### DETERMINE BENEFITS ###
+        
+        np.subtract(P, C, out=D) # update inefficiencies
+        np.min(D, axis=1, keepdims=True, out=k1)
+        np.max(D, axis=1, keepdims=True, out=k2)
+        np.subtract(k2, k1, out=k2)
+        np.subtract(D, k1, out=nk1)
+        np.divide(nk1, k2, out=nk1)
+        np.negative(nk1, out=nk1)
+        np.subtract(nk1, .5, out=nk1)
+        np.exp(nk1, out=nk1)
+        np.add(nk1, 1, out=nk1)
+        np.reciprocal(nk1, out=nk1) # social norm factor
+        np.multiply(nk1, phi, out=nk1)
+        np.less(state.uniforms.draw(U1), nk1, out=nkf) # monitoring outcomes (as zeros and ones)
+        np.multiply(D, nkf, out=nk1)
+        np.add(H, nk1, out=H) # accumulate spotted inefficiencies
+        np.multiply(nkf, tau, out=nk2)
+        np.subtract(1, nk2, out=nk2)
+        np.multiply(nk2, D, out=nk2)
+        np.multiply(dIns, C, out=Ft)
+        np.add(Ft, nk2, out=Ft)
+        np.divide(Ft, P, out=Ft) # compute benefits (in the buffer of the lagged benefits)
+        F, Ft = Ft, F # update lagged benefits
+        
+        
+        ### DETERMINE INDICATORS ###
+        
+        np.max(P, axis=1, keepdims=True, out=k1)
+        np.divide(C, k1, out=cnormr) # normalized contributions (zero for non-instrumental nodes)
+        
+        # compute spillovers
+        if self.At_dense is not None:
+            np.dot(dI, self.At_dense, out=S)
+        else:
+            S[:] = self.At.dot(dI.T).T
+        np.subtract(T, I, out=gaps) # current target-indicator gaps
+        np.divide(gaps, self.gaps0, out=NK1)
+        np.mean(NK1, axis=1, keepdims=True, out=k3)
+        np.divide(S, k3, out=NK1)
+        np.negative(NK1, out=NK1)
+        np.exp(NK1, out=NK1)
+        np.add(NK1, alpha, out=NK1)
+        np.add(cnorm, alpha, out=NK2)
+        np.divide(NK2, NK1, out=NK2) # compute probability of succesful growth
+        U = state.uniforms.draw(U2) # one number per indicator in the original order
+        if self.reordered:
+            U = np.take(U, self.order, axis=1, out=U2p, mode='clip')
+        np.less(U, NK2, out=NK2) # determine if there is succesful growrth (as zeros and ones)
+        np.multiply(gaps, alpha, out=NK1)
+        np.multiply(NK1, NK2, out=NK1)
+        np.add(I, NK1, out=It) # update indicators (in the buffer of the lagged indicators)
+        I, It = It, I # update lagged indicators
+        
+        
+        ### DETERMINE ALLOCATIONS ###
+        
+        np.min(gapsr, axis=1, keepdims=True, out=k1) # target-indicator gaps of instrumental indicators
+        np.max(gapsr, axis=1, keepdims=True, out=k2)
+        np.subtract(k2, k1, out=k2)
+        np.subtract(gapsr, k1, out=nk1)
+        np.divide(nk1, k2, out=nk1) # normalize gaps
+        np.multiply(nk1, 1-1e-6, out=nk1)
+        np.add(nk1, 1e-12, out=nk1) # make sure all gaps are greater than zero
+        
+        # normalize historical inefficiencies
+        np.equal(H, 1, out=nkf)
+        np.sum(nkf, axis=1, keepdims=True, out=k3)
+        np.less(k3, n, out=k1b)
+        np.min(H, axis=1, keepdims=True, out=k1)
+        np.max(H, axis=1, keepdims=True, out=k2)
+        np.subtract(k2, k1, out=k2)
+        np.subtract(H, k1, out=nk2)
+        np.divide(nk2, k2, out=nk2, where=k1b) # the rows where all H==1 are left at H-min(H)=0
+        np.multiply(nk2, 1-1e-6, out=nk2)
+        np.add(nk2, 1e-12, out=nk2) # make sure all elements are greater than zero
+        
+        # compute policy priorities (with default function or user-given one)
+        if self.gov_func is not None:
+            for i in range(k):
+                P[i] = self.gov_func(nk1[i], nk2[i]) # determine propensities with user-given function
+        else: 
+            np.add(nk2, 1, out=nk2)
+            np.power(nk1, nk2, out=P)
+        np.sum(P, axis=1, keepdims=True, out=k1)
+        np.divide(P, k1, out=P) # normalize priorities
+        
+        # check if exogenous priorities are given
+        if self.PF is not None:
+            np.less(state.uniforms.draw(U3), self.pf, out=kb)
+            np.copyto(P, self.PF, where=kbc) # use exogenous policy priorities
+        
+        state.I, state.It, state.F, state.Ft, state.X, state.Xt = I, It, F, Ft, X, Xt
+        
+        # update convergence ticks
+        np.subtract(T, I, out=NK1)
+        np.abs(NK1, out=NK1)
+        np.greater_equal(NK1, self.tolerance, out=NKb)
+        np.copyto(state.tick_rows, state.step, where=NKb)
+        if state.horizon is None:
+            np.any(NKb, axis=1, out=kb)
+            np.logical_not(kb, out=state.finish)
+        else:
+            state.finish[:] = state.step > state.horizon # the horizon was reached
+        
+        # store the final values if all the replicas have converged
+        if state.finish.all():
+            self._remove_finished(state)
+        
+        return state.active
+    
+    
+    def run_many(self, n_replicas=100, P0=None, H0=None, outputs='all', seed=None, state=None,
+                 horizon=None):
+        """Runs several independent simulations of the model at once.
+
+        Parameters
+        ----------
+            n_replicas: int, optional
+                The number of simulations to be performed.
+            P0: numpy array, optional
+                An array with the initial allocation profile.
+            H0: numpy array, optional
+                The initial vector of historical inefficiencies.
+            outputs: str, optional
+                The outputs to be recorded and returned: 'all', 'indicators', 
+                'final' or 'ticks' (see run_ppi).
+            seed: int, numpy SeedSequence or numpy Generator, optional
+                The seed of the random number generator. If not given, the 
+                global generator of numpy (np.random) is used.
+            state: PPIState, optional
+                A state to resume (e.g. a fork or a state loaded from a file) 
+                instead of new replicas, in which case n_replicas, P0, H0 and 
+                seed are ignored. The state is advanced in place until all its
+                replicas converge, and the time series start at its current 
+                period.
+            horizon: int, optional
+                A fixed number of periods to be simulated (see run_ppi), counted
+                from the start of the simulation. All the time series have the
+                same length, and they are preallocated. If not given (and the 
+                state has no horizon), each replica is simulated until it 
+                converges. The horizon of a resumed state cannot be earlier 
+                than the periods that it has already simulated; if it equals 
+                them, the time series are empty.
+            
+        Returns
+        -------
+            The same outputs as run_ppi_batch.
+        """
+        if outputs not in ('all', 'indicators', 'final', 'ticks'):
+            raise ValueError("outputs must be 'all', 'indicators', 'final' or 'ticks'")
+        rec_all = outputs == 'all' # flag to record all the time series
+        rec_ind = outputs in ('all', 'indicators') # flag to record the indicators
+        
+        if state is None:
+            state = self.init_state(n_replicas, P0=P0, H0=H0, seed=seed, horizon=horizon)
+        elif horizon is not None:
+            horizon = check_horizon(horizon)
+            if horizon < state.step-1:
+                raise ValueError('the state has already simulated %i periods, more than the horizon' % (state.step-1))
+            state.horizon = horizon
+            if state.step > horizon:
+                state.finish[:] = True # the horizon was already reached
+        K = state.K
+        first = state.step # first recorded period
+        keys = 'ICFPDS' if rec_all else 'I' if rec_ind else '' # time series to be recorded
+        records = dict((key, []) for key in keys) # stores the states of the active replicas
+        rec_ids = [] # stores which replicas were active in each period
+        
+        # with a fixed horizon, the time series are preallocated (periods x replicas x indicators)
+        if state.horizon is not None:
+            periods = max(state.horizon-first+1, 0)
+            records = dict((key, np.zeros((periods, K, self.N if key in 'IS' else self.n), dtype=self.dtype))
+                           for key in keys)
+        
+        def store(key, t, ids, values):
+            """Stores the values of the active replicas in a time series and
+            returns a copy of them."""
+            if state.horizon is None:
+                records[key].append(values.copy())
+                return records[key][-1]
+            records[key][t, ids] = values
+            return records[key][t, ids]
+        
+        while True: # iterate until all replicas have converged
+            
+            self._remove_finished(state)
+            if len(state.ids) == 0:
+                break
+            
+            ids, t = state.ids, state.step-first # active replicas and recorded period
+            if rec_ind:
+                rec_ids.append(ids)
+                store('I', t, ids, self._external(state.I)) # store this period's indicators
+            if rec_all:
+                P = store('P', t, ids, state.P) # store this period's allocations
+                store('F', t, ids, state.F) # store this period's benefits
+            
+            self.step(state)
+            
+            if rec_all:
+                C = store('C', t, ids, state.C) # store this period's contributions
+                store('D', t, ids, P-C) # store this period's inefficiencies
+                store('S', t, ids, self._external(state.S)) # save spillovers
+        
+        
+        ticks = state.ticks
+        if outputs == 'ticks':
+            return ticks
+        elif outputs == 'final':
+            return state.I_final, state.P_final, ticks, state.H_final
+        
+        # assemble the time series of each replica
+        all_series = []
+        for key in keys:
+            series = records[key]
+            if state.horizon is not None:
+                all_series.append([series[0:max(state.lengths[i]-first+1, 0), i].T for i in range(K)])
+                continue
+            if len(series) == 0: # the replicas of the state had already converged
+                all_series.append([np.zeros((self.N if key in 'IS' else self.n, 0), dtype=self.dtype)
+                                   for i in range(K)])
+                continue
+            full = np.zeros((len(series), K, series[0].shape[1]), dtype=self.dtype)
+            for t in range(len(series)):
+                full[t, rec_ids[t]] = series[t]
+            all_series.append([full[0:max(state.lengths[i]-first+1, 0), i].T for i in range(K)])
+        
+        if outputs == 'indicators':
+            return all_series[0], ticks, state.H_final
+        tsI, tsC, tsF, tsP, tsD, tsS = all_series
+        return tsI, tsC, tsF, tsP, tsD, tsS, ticks, state.H_final
+    
+    
+    def run(self, P0=None, H0=None, outputs='all', seed=None, horizon=None):
+        """Runs one simulation of the model.
+
+        Parameters
+        ----------
+            P0: numpy array, optional
+                An array with the initial allocation profile.
+            H0: numpy array, optional
+                The initial vector of historical inefficiencies.
+            outputs: str, optional
+                The outputs to be recorded and returned: 'all', 'indicators', 
+                'final' or 'ticks' (see run_ppi).
+            seed: int, numpy SeedSequence or numpy Generator, optional
+                The seed of the random number generator. If not given, the 
+                global generator of numpy (np.random) is used.
+            horizon: int, optional
+                A fixed number of periods to be simulated (see run_ppi).
+            
+        Returns
+        -------
+            The same outputs as run_ppi.
+        """
+        results = self.run_many(1, P0=P0, H0=H0, outputs=outputs, seed=seed, horizon=horizon)
+        if outputs == 'ticks':
+            return results[0]
+        return tuple(result[0] for result in results)
+
+
+
+
+def prepare_network(A, N, sparse=None):
+    """Prepares the spillover network for the simulation. The diagonal is set to
+    zero and the matrix is transposed, so the spillovers received by the
+    indicators are computed as the product of this matrix and the vector of
+    changes in the indicators.
+
+    Parameters
+    ----------
+        A:  2D numpy array or scipy sparse matrix
+            The adjacency matrix of the spillover network of development 
+            indicators. If None, the model assumes a zero-matrix, so there 
+            are no spillovers.
+        N: int
+            The number of indicators.
+        sparse: bool, optional
+            Whether to return a sparse matrix (in CSR format). If not given, a 
+            sparse matrix is returned when the share of non-zero entries is 
+            lower than SPARSE_DENSITY. Sparse matrices require Scipy.
+        
+    Returns
+    -------
+        At: 2D numpy array or scipy sparse matrix
+            The transposed adjacency matrix without self-loops.
+    """
+    if sp is None:
+        if sparse:
+            raise ImportError('Scipy is required to use sparse networks')
+        sparse = False
+    
+    # if no network is provided, create a zero-matrix
+    if A is None:
+        if sparse is False:
+            return np.zeros((N,N))
+        return sp.csr_matrix((N,N))
+    
+    if sp is not None and sp.issparse(A):
+        A = sp.csr_matrix(A, dtype=float, copy=True)
+        A.setdiag(0)
+        A.eliminate_zeros()
+        if sparse is None:
+            sparse = A.nnz < SPARSE_DENSITY*N*N
+        if not sparse:
+            return A.T.toarray()
+        return A.T.tocsr()
+    
+    A = np.array(A, dtype=float)
+    np.fill_diagonal(A, 0)
+    if sparse is None:
+        sparse = np.count_nonzero(A) < SPARSE_DENSITY*N*N
+    if sparse:
+        return sp.csr_matrix(A.T)
+    return A.T
+
+
+
+def check_horizon(horizon):
+    """Validates a fixed number of periods to be simulated.
+
+    Parameters
+    ----------
+        horizon: int or None
+            The number of periods (see run_ppi).
+        
+    Returns
+    -------
+        horizon: int or None
+            The same horizon as a Python int, or None if it is not given.
+    """
+    if horizon is None:
+        return None
+    if isinstance(horizon, (bool, np.bool_)) or not isinstance(horizon, (int, np.integer)) or horizon < 1:
+        raise ValueError('horizon must be None or a positive integer number of periods')
+    return int(horizon)
+
+
+def get_rng(seed=None):
+    """Returns the random number generator to be used in a simulation.
+
+    Parameters
+    ----------
+        seed: int, numpy SeedSequence or numpy Generator, optional
+            The seed of the generator. A Generator is returned as it is.
+        
+    Returns
+    -------
+        rng: numpy Generator or the numpy.random module
+            A new Generator (PCG64) created from the seed or, if no seed is 
+            given, the numpy.random module, so the global generator of numpy
+            is used.
+    """
+    if seed is None:
+        return np.random
+    return np.random.default_rng(seed)
+
+
+def spawn_seeds(seed, n):
+    """Creates independent seeds for several simulations (or tasks) from a 
+    single seed, so they can run in any order or in different processes and
+    still produce the same results.
+
+    Parameters
+    ----------
+        seed: int, numpy SeedSequence or numpy Generator
+            The seed from which the new seeds are spawned. If it is a Generator,
+            the new seeds are drawn from it (so consecutive calls give different
+            seeds). If None, fresh entropy is used.
+        n: int
+            The number of seeds.
         
-    return np.array(tsI).T, np.array(tsC).T, np.array(tsF).T, np.array(tsP).T, np.array(tsD).T, np.array(tsS).T, ticks, H
+    Returns
+    -------
+        seeds: list
+            A list of numpy SeedSequence objects.
+    """
+    if isinstance(seed, np.random.Generator):
+        seed = np.random.SeedSequence(seed.integers(2**63, size=4))
+    elif not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    return seed.spawn(n)
+
+
+def child_seed(seed, *key):
+    """Creates the seed of a task identified by a key, e.g. (iteration, node).
+    Unlike spawn_seeds, the seed of a task does not depend on how many seeds 
+    were created before it.
+
+    Parameters
+    ----------
+        seed: int or numpy SeedSequence
+            The seed of the whole computation. If None, fresh entropy is used.
+        key: int
+            Non-negative integers that identify the task.
+        
+    Returns
+    -------
+        seed: numpy SeedSequence
+            The seed of the task.
+    """
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    return np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key+tuple(key),
+                                  pool_size=seed.pool_size)
 
 
+def fill_uniform(rng, out):
+    """Fills an array of floats with uniform random numbers in [0,1).
 
+    Parameters
+    ----------
+        rng: numpy Generator or the numpy.random module
+            The random number generator (see get_rng). The numbers are written
+            directly into 'out' when it is a Generator.
+        out: numpy array
+            The array to be filled.
+        
+    Returns
+    -------
+        out: numpy array
+            The filled array.
+    """
+    if isinstance(rng, np.random.Generator):
+        rng.random(out=out)
+    else:
+        out[...] = rng.random(out.shape)
+    return out
+
+
+
+class UniformBlock(object):
+    """Supplies the uniform random numbers of a simulation from large blocks.
+    
+    Drawing a few numbers per call is dominated by the overhead of the call, so
+    the numbers of many periods (or replicas) are drawn from a Generator at once
+    and handed out as consecutive slices of the block. The slices follow the 
+    order of the Generator's stream, so a simulation gets exactly the same 
+    numbers as if they were drawn one call at a time. With the global generator
+    of numpy (np.random), the numbers are drawn on demand, so the global state 
+    is not advanced beyond what the simulation uses.
+
+    Parameters
+    ----------
+        rng: numpy Generator or the numpy.random module
+            The random number generator (see get_rng).
+        size: int, optional
+            The number of random numbers drawn at once. It is at least 
+            UNIFORM_BLOCK.
+    """
+    
+    def __init__(self, rng, size=UNIFORM_BLOCK):
+        self.rng = rng
+        self.block = isinstance(rng, np.random.Generator) # whether to draw in blocks
+        self.buffer = np.zeros(max(size, UNIFORM_BLOCK) if self.block else 0)
+        self.position = len(self.buffer) # next unused number of the buffer
+    
+    def take(self, size):
+        """Returns a vector with the next 'size' random numbers. The vector is
+        a view of the block, so it is only valid until the next call."""
+        if not self.block:
+            return self.rng.random(size)
+        buffer = self.buffer
+        if self.position + size > len(buffer):
+            left = len(buffer) - self.position # unused numbers of the current block
+            if size > len(buffer):
+                buffer = self.buffer = np.concatenate((buffer[self.position:], np.zeros(size)))
+            else:
+                buffer[0:left] = buffer[self.position:]
+            self.rng.random(out=buffer[left:])
+            self.position = 0
+        values = buffer[self.position:self.position+size]
+        self.position += size
+        return values
+    
+    def draw(self, out):
+        """Returns an array with the shape of 'out' with the next random numbers.
+        With a Generator, it is a view of the block and 'out' is not used; 
+        otherwise, the numbers are written into 'out'."""
+        if not self.block:
+            return fill_uniform(self.rng, out)
+        return self.take(out.size).reshape(out.shape)
     
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if not self.block:
+            state['rng'] = None # the global generator of numpy is not copied
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.rng is None:
+            self.rng = np.random
+
+
+
+class PhaseProfile(object):
+    """Measures the time spent in each phase of run_ppi, e.g. to find out whether
+    a simulation is dominated by the spillovers, the random numbers or the 
+    government function.
+    
+    The phases are the ones marked in run_ppi ('contributions', 'benefits', 
+    'indicators' and 'allocations'), but three of their parts are measured 
+    separately: the product of the network and the changes of the indicators
+    ('spillovers'), the draws of random numbers ('random') and the calls to a 
+    user-given government function ('gov_func'). The same object can be passed
+    to several simulations to accumulate their measurements. The measurements
+    only happen when an object is passed, so the simulations without one do not
+    pay for them.
+
+    Parameters
+    ----------
+        memory: bool, optional
+            Whether to measure the memory allocated in each phase (with the 
+            tracemalloc module of Python). It makes the simulation much slower,
+            so the times are not representative when it is used.
+        callback: function, optional
+            A function called at the end of each phase with the name of the 
+            phase, the simulation step and the duration of the phase in seconds.
+
+    Attributes
+    ----------
+        times: dictionary
+            The total seconds spent in each phase.
+        calls: dictionary
+            The number of times that each phase was measured.
+        allocated: dictionary
+            The total bytes allocated in each phase (only with memory=True). For 
+            each call of a phase, it adds the growth of the memory in use up to 
+            its peak within the phase, so it counts the temporary arrays too.
+        peak: dictionary
+            The largest bytes allocated by a single call of each phase (only with 
+            memory=True).
+        steps: int
+            The number of simulation steps.
+        runs: int
+            The number of simulations.
+        elapsed: float
+            The total seconds of the simulations (excluding their initialization).
+    """
+    
+    def __init__(self, memory=False, callback=None):
+        self.memory = memory
+        self.callback = callback
+        self.times = {}
+        self.calls = {}
+        self.allocated = {}
+        self.peak = {}
+        self.steps = 0
+        self.runs = 0
+        self.elapsed = 0.
+        self.step = 0 # step of the current simulation
+        self.tracing = False # whether tracemalloc was started by this object
+    
+    def start(self):
+        """Starts measuring a simulation."""
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.tracing = True
+            self.used = tracemalloc.get_traced_memory()[0]
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+        self.runs += 1
+        self.step = 0
+        self.began = self.last = time.perf_counter()
+    
+    def lap(self, phase, step=False):
+        """Attributes the time since the last call (or since start) to a phase.
+        If 'step' is True, the phase closes a simulation step."""
+        now = time.perf_counter()
+        seconds = now - self.last
+        self.times[phase] = self.times.get(phase, 0.) + seconds
+        self.calls[phase] = self.calls.get(phase, 0) + 1
+        if self.memory:
+            used, peak = tracemalloc.get_traced_memory()
+            growth = max(peak - self.used, 0)
+            self.allocated[phase] = self.allocated.get(phase, 0) + growth
+            self.peak[phase] = max(self.peak.get(phase, 0), growth)
+            self.used = used
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+        if self.callback is not None:
+            self.callback(phase, self.step, seconds)
+        if step:
+            self.step += 1
+            self.steps += 1
+        self.last = time.perf_counter() # exclude the time of the measurement itself
+    
+    def stop(self):
+        """Stops measuring a simulation."""
+        self.elapsed += time.perf_counter() - self.began
+        if self.tracing:
+            tracemalloc.stop()
+            self.tracing = False
+    
+    def summary(self):
+        """Returns a table with the total seconds, the share of the time, the 
+        microseconds per step and (with memory=True) the allocated bytes of 
+        each phase, sorted from the slowest phase."""
+        total = sum(self.times.values())
+        lines = ['%-15s%12s%10s%14s' % ('phase', 'seconds', 'share', 'us/step')]
+        if self.memory:
+            lines[0] += '%16s%14s' % ('allocated', 'peak')
+        for phase in sorted(self.times, key=self.times.get, reverse=True):
+            line = '%-15s%12.4f%9.1f%%%14.2f' % (phase, self.times[phase], 100*self.times[phase]/max(total, 1e-12),
+                                                 1e6*self.times[phase]/max(self.steps, 1))
+            if self.memory:
+                line += '%16i%14i' % (self.allocated[phase], self.peak[phase])
+            lines.append(line)
+        lines.append('%i simulations, %i steps, %.4f seconds' % (self.runs, self.steps, self.elapsed))
+        return '\n'.join(lines)
+
+
 
 def get_targets(series):
     """Transforms a collection of series where one or more targets are less or
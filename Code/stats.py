@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+"""Policy Priority Inference for Sustainable Development - Streaming Statistics
+
+Authors: Omar A. Guerrero & Gonzalo Castañeda
+Written in Pyhton 3.7
+Acknowledgments: This product was developed through the sponsorship of the
+    United Nations Development Programme (bureau for Latin America)
+    and with the support of the National Laboratory for Public Policies (Mexico City),
+    the Centro de Investigación y Docencia Económica (CIDE, Mexico City),
+    and The Alan Turing Institute (London).
+
+This file contains support classes to summarize the outputs of many simulations
+as they are produced, so the memory does not grow with the number of simulations.
+The main classes are:
+
+    RunningStats: keeps the count, mean and variance of a stream of observations
+    (Welford's algorithm), and optionally a uniform random sample of them
+    (a reservoir) to estimate quantiles.
+    MonteCarloAggregator: keeps the statistics of the time series, convergence
+    times and historical inefficiencies of many simulations of the model, one 
+    simulation (or batch of simulations) at a time.
+
+
+Example
+-------
+To compute the standard deviation of the changes of the simulated indicators:
+
+    changes = RunningStats()
+    for run in range(1000):
+        tsI, ticks, H = run_ppi(I0, T, outputs='indicators')
+        changes.update((tsI[:,1:]-tsI[:,0:-1]).ravel())
+    vola = changes.std
+
+To compute the average time series of the indicators and allocations of 100,000
+simulations without storing them:
+
+    aggregator = MonteCarloAggregator(reservoir=1000)
+    for run in range(100000):
+        tsI, tsC, tsF, tsP, tsD, tsS, ticks, H = run_ppi(I0, T)
+        aggregator.add(ticks=ticks, H=H, I=tsI, P=tsP)
+    mean_tsI = aggregator.mean('I')
+
+
+Rquired external libraries
+--------------------------
+- Numpy
+
+
+"""
+
+# import necessary libraries
+from __future__ import division, print_function
+import numpy as np
+
+
+
+class RunningStats(object):
+    """Streaming mean and variance of a sequence of observations.
+
+    Each observation can be a scalar or an array of a fixed shape, in which
+    case the statistics are computed element by element. The observations are
+    folded in by batches with the parallel version of Welford's algorithm
+    (Chan et al.), which is numerically stable and uses constant memory.
+
+    Parameters
+    ----------
+        shape: tuple, optional
+            The shape of each observation. By default, the observations are
+            scalars.
+        reservoir: int, optional
+            The size of a uniform random sample of the observations (reservoir
+            sampling) kept to estimate quantiles. If zero, no sample is kept.
+        seed: int, numpy SeedSequence or numpy Generator, optional
+            The seed of the random number generator of the reservoir.
+
+    Attributes
+    ----------
+        count: int
+            The number of observations.
+        mean: numpy array
+            The mean of the observations.
+        var: numpy array
+            The variance (with zero degrees of freedom, as numpy.var) of the
+            observations.
+        std: numpy array
+            The standard deviation (with zero degrees of freedom, as numpy.std)
+            of the observations.
+    """
+
+    def __init__(self, shape=(), reservoir=0, seed=None):
+        self.shape = tuple(shape)
+        self.count = 0
+        self.mean = np.zeros(self.shape)
+        self.m2 = np.zeros(self.shape) # sum of squared differences from the mean
+        self.reservoir = reservoir
+        self.sample = np.zeros((reservoir,)+self.shape) if reservoir > 0 else None
+        self.rng = np.random.default_rng(seed)
+
+    @property
+    def var(self):
+        if self.count == 0:
+            return np.full(self.shape, np.nan)
+        return self.m2/self.count
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+
+    def _combine(self, count, mean, m2):
+        """Combines the current statistics with the ones of another set of
+        observations."""
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta*count/total
+        self.m2 = self.m2 + m2 + delta**2*self.count*count/total
+        self.count = total
+
+
+    def update(self, values):
+        """Adds a batch of observations.
+
+        Parameters
+        ----------
+            values: numpy array
+                An array in which the first dimension indexes the observations
+                and the rest has the shape of an observation. For scalar
+                observations, any array is flattened.
+        """
+        values = np.asarray(values, dtype=float).reshape((-1,)+self.shape)
+        size = len(values)
+        if size == 0:
+            return
+        previous = self.count
+        mean = values.mean(axis=0)
+        m2 = ((values-mean)**2).sum(axis=0)
+        self._combine(size, mean, m2)
+
+        # reservoir sampling (algorithm R) of the new observations
+        if self.sample is not None:
+            positions = previous + np.arange(size) # positions of the observations in the stream
+            fill = positions < self.reservoir
+            self.sample[positions[fill]] = values[fill]
+            slots = self.rng.integers(0, positions[~fill]+1) # random slot of each observation
+            keep = slots < self.reservoir
+            self.sample[slots[keep]] = values[~fill][keep]
+
+
+    def add(self, value):
+        """Adds a single observation.
+
+        Parameters
+        ----------
+            value: float or numpy array
+                An observation with the shape given when the object was created.
+        """
+        self.update(np.asarray(value, dtype=float)[np.newaxis])
+
+
+    def merge(self, other):
+        """Adds the observations summarized by another RunningStats object,
+        e.g. one computed by a different process.
+
+        Parameters
+        ----------
+            other: RunningStats
+                The statistics to be merged. They must have the same shape and
+                reservoir size.
+        """
+        if other.count == 0:
+            return
+        previous = self.count
+        self._combine(other.count, other.mean, other.m2)
+
+        # draw the merged reservoir from both reservoirs in proportion to their counts
+        if self.sample is not None:
+            mine = self.sample[0:min(previous, self.reservoir)]
+            theirs = other.sample[0:min(other.count, self.reservoir)]
+            size = min(self.count, self.reservoir)
+            from_mine = self.rng.binomial(size, previous/self.count)
+            from_mine = min(max(from_mine, size-len(theirs)), len(mine))
+            self.sample[0:from_mine] = mine[self.rng.permutation(len(mine))[0:from_mine]]
+            self.sample[from_mine:size] = theirs[self.rng.permutation(len(theirs))[0:size-from_mine]]
+
+
+    def quantile(self, q):
+        """Estimates quantiles of the observations from the reservoir.
+
+        Parameters
+        ----------
+            q: float or numpy array
+                The probabilities of the quantiles, in [0,1].
+
+        Returns
+        -------
+            quantiles: numpy array
+                The estimated quantiles. The first dimension corresponds to 'q'
+                if it is an array.
+        """
+        if self.sample is None:
+            raise ValueError('quantiles require a reservoir (reservoir > 0)')
+        return np.quantile(self.sample[0:min(self.count, self.reservoir)], q, axis=0)
+
+
+
+class MonteCarloAggregator(object):
+    """Streaming statistics of the outputs of many simulations of the model.
+
+    The time series of each simulation (e.g. tsI or tsP, with one row per 
+    indicator and one column per period) are folded into statistics per 
+    indicator and per period. Simulations have different lengths, so each 
+    series is padded with its final value up to the longest simulation seen so
+    far. When a longer simulation arrives, the statistics of the new periods
+    start from the statistics of the final values of the previous simulations,
+    which is what padding them would give. Hence, the memory depends on the 
+    number of indicators and periods, but not on the number of simulations.
+
+    Parameters
+    ----------
+        reservoir: int, optional
+            The size of the random sample of simulations kept to estimate the
+            quantiles (see RunningStats). If zero, no quantiles are estimated.
+        seed: int or numpy SeedSequence, optional
+            The seed of the random number generators of the samples.
+
+    Attributes
+    ----------
+        runs: int
+            The number of simulations.
+        ticks: RunningStats
+            The statistics of the convergence times of each indicator.
+        H: RunningStats
+            The statistics of the final historical inefficiencies.
+        series: dictionary
+            The statistics (RunningStats) of each time series, by name, with 
+            the shape (indicators, periods).
+    """
+
+    def __init__(self, reservoir=0, seed=None):
+        self.reservoir = reservoir
+        self.seeds = np.random.SeedSequence(seed)
+        self.runs = 0
+        self.ticks = None
+        self.H = None
+        self.series = {}
+        self.finals = {} # statistics of the final values of each time series
+
+    def _stats(self, shape):
+        """Creates the statistics of a new output."""
+        return RunningStats(shape, self.reservoir, self.seeds.spawn(1)[0])
+
+    def _extend(self, name, steps):
+        """Extends the statistics of a time series to a longer number of periods."""
+        old, final = self.series[name], self.finals[name]
+        length = old.shape[1]
+        new = RunningStats((old.shape[0], steps), self.reservoir, old.rng)
+        new.count = old.count
+        for attribute in ('mean', 'm2', 'sample'):
+            if getattr(old, attribute) is not None:
+                values = getattr(new, attribute)
+                values[...,0:length] = getattr(old, attribute)
+                values[...,length:] = getattr(final, attribute)[...,np.newaxis]
+        self.series[name] = new
+
+    def update(self, ticks=None, H=None, **series):
+        """Adds the outputs of a batch of simulations.
+
+        Parameters
+        ----------
+            ticks: 2D numpy array, optional
+                The convergence times, with one row per simulation.
+            H: 2D numpy array, optional
+                The final historical inefficiencies, with one row per simulation.
+            series: lists of 2D numpy arrays, optional
+                The time series of the simulations, passed by name, e.g. 
+                I=all_tsI, where all_tsI is a list with the tsI matrix of each
+                simulation (as returned by run_ppi_batch).
+        """
+        size = None
+        if ticks is not None:
+            ticks = np.asarray(ticks, dtype=float)
+            if self.ticks is None:
+                self.ticks = self._stats(ticks.shape[1:])
+            self.ticks.update(ticks)
+            size = len(ticks)
+        if H is not None:
+            H = np.asarray(H, dtype=float)
+            if self.H is None:
+                self.H = self._stats(H.shape[1:])
+            self.H.update(H)
+            size = len(H)
+        for name, runs in series.items():
+            steps = max(ts.shape[1] for ts in runs)
+            if name not in self.series:
+                self.series[name] = self._stats((runs[0].shape[0], steps))
+                self.finals[name] = self._stats(runs[0].shape[0:1])
+            elif steps > self.series[name].shape[1]:
+                self._extend(name, steps)
+            steps = self.series[name].shape[1]
+            padded = np.stack([np.concatenate((ts, np.repeat(ts[:,-1:], steps-ts.shape[1], axis=1)), axis=1) 
+                               for ts in runs])
+            self.series[name].update(padded)
+            self.finals[name].update(np.stack([ts[:,-1] for ts in runs]))
+            size = len(runs)
+        if size is not None:
+            self.runs += size
+
+    def add(self, ticks=None, H=None, **series):
+        """Adds the outputs of a single simulation.
+
+        Parameters
+        ----------
+            ticks: numpy array, optional
+                The convergence times of the simulation.
+            H: numpy array, optional
+                The final historical inefficiencies.
+            series: 2D numpy arrays, optional
+                The time series of the simulation, passed by name, e.g. I=tsI.
+        """
+        self.update(ticks=None if ticks is None else np.asarray(ticks)[np.newaxis],
+                    H=None if H is None else np.asarray(H)[np.newaxis],
+                    **dict((name, [ts]) for name, ts in series.items()))
+
+    def mean(self, name):
+        """Returns the mean of a time series (indicators x periods)."""
+        return self.series[name].mean
+
+    def std(self, name):
+        """Returns the standard deviation of a time series (indicators x periods)."""
+        return self.series[name].std
+
+    def quantile(self, name, q):
+        """Returns quantiles of a time series (see RunningStats.quantile)."""
+        return self.series[name].quantile(q)
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""Policy Priority Inference for Sustainable Development - Subnational Calibration
+
+Authors: Omar A. Guerrero & Gonzalo Castañeda
+Written in Pyhton 3.7
+Acknowledgments: This product was developed through the sponsorship of the
+    United Nations Development Programme (bureau for Latin America)
+    and with the support of the National Laboratory for Public Policies (Mexico City),
+    the Centro de Investigación y Docencia Económica (CIDE, Mexico City),
+    and The Alan Turing Institute (London).
+
+This file contains the functions to calibrate the model for every state in the
+Subnational_data folder of the public repository: https://github.com/oguerrer/PPI4SD.
+The main functions are:
+
+    load_state: loads the indicators and the network of a state and prepares
+    them for PPI.
+    calibrate_states: calibrates the number of periods for convergence and the
+    growth factors of several states, sharing a single pool of processes, and
+    writes the growth factors in the same format as Subnational_data/alphas.
+
+
+Example
+-------
+To recalibrate all the states with the national governance parameters:
+
+    phi, tau = np.loadtxt('National_data/governance_params.csv')
+    results = calibrate_states('Subnational_data', phi, tau, output='new_calibration')
+
+
+Rquired external libraries
+--------------------------
+- Numpy
+- Pandas: to read the files of indicators (see data.py).
+
+
+"""
+
+# import necessary libraries
+from __future__ import division, print_function
+import os
+import threading
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+# the ppi.py and calibration.py files should be in the same folder
+from ppi import get_targets, child_seed
+from calibration import find_steps
+from executors import get_executor
+from data import load_table, load_network
+
+
+
+def list_states(folder):
+    """Returns the codes of the states with indicators in a subnational data folder.
+
+    Parameters
+    ----------
+        folder: str
+            The path of the subnational data folder.
+
+    Returns
+    -------
+        states: list
+            The sorted codes of the states (e.g. 'AGU').
+    """
+    files = os.listdir(os.path.join(folder, 'samples_normalized'))
+    return sorted(file[0:-4] for file in files if file.endswith('.csv'))
+
+
+def load_state(folder, state):
+    """Loads the data of a state and prepares it for PPI.
+
+    Parameters
+    ----------
+        folder: str
+            The path of the subnational data folder.
+        state: str
+            The code of the state (e.g. 'AGU').
+
+    Returns
+    -------
+        data: dictionary
+            The initial values ('I0'), targets ('T'), network ('A', a scipy
+            sparse matrix, from the compact file networks/<STATE>.npz if it 
+            exists), instrumental
+            indicators ('R') and the empirical volatility ('vola_emp') of the
+            indicators of the state, as computed in the calibration example.
+    """
+    sample = load_table(os.path.join(folder, 'samples_normalized', state+'.csv'))
+    years = [column for column in sample.columns if column.isdigit()]
+    series = sample[years].values
+    I0, T = get_targets(series)
+    network = os.path.join(folder, 'networks', state)
+    A = load_network(network+'.npz' if os.path.exists(network+'.npz') else network+'.csv')
+    if A.shape != (len(I0), len(I0)):
+        raise ValueError('the network of %s does not match its indicators' % state)
+
+    # empirical volatility (only the positive changes)
+    changes = (series[:, 1::]-series[:, 0:-1]).flatten()
+    changes[changes<0] = 0
+
+    return dict(I0=I0, T=T, A=A, R=sample['instrumental'].values, vola_emp=changes.std())
+
+
+def calibrate_states(folder, phi, tau, states=None, output=None, steps=10, sample_size=10,
+                     dev_lim=3, search='linear', parallel_processes=4, backend='process',
+                     seed=None, method='greedy'):
+    """Calibrates the number of periods for convergence and the growth factors
+    of several states.
+
+    The calibration of each state (see calibration.find_steps) is driven by its
+    own thread, and the searches of the growth factors of all the states are
+    queued in a single pool of processes, so the processes stay busy until the
+    last state is calibrated. For each state, the chosen number of periods is
+    the one whose simulated volatility is the closest to the empirical one.
+
+    Parameters
+    ----------
+        folder: str
+            The path of the subnational data folder.
+        phi: float
+            The quality of the monitoring mechanisms (the same for every state).
+        tau: float
+            The quality of the rule of law (the same for every state).
+        states: list, optional
+            The codes of the states to be calibrated. If not given, all the
+            states of the folder are calibrated.
+        output: str, optional
+            A folder where the growth factors of each state are saved as
+            'alphas/<STATE>.csv' (one value per line, as in the subnational
+            data folder), together with a summary 'steps.csv' with the calibrated
+            number of periods and volatilities of every state.
+        steps, sample_size, dev_lim, search: optional
+            The parameters of the calibration of each state (see find_steps).
+        parallel_processes: int, optional
+            The number of processes (or threads) of the shared pool.
+        backend: str, optional
+            'thread', 'process', 'joblib' or 'serial' (see executors.get_executor).
+        seed: int or numpy SeedSequence, optional
+            The seed of the calibration. Each state gets its own seed, derived
+            from this one and from the position of the state in 'states'.
+        method: str, optional
+            'greedy' queues the searches of the growth factors in the shared 
+            pool and 'joint' searches the growth factors of each state together
+            in its driver thread (see calibration.estimate), which requires far
+            fewer simulations. The 'scheduled' method is not available, since 
+            it needs a pool of processes for each state.
+
+    Returns
+    -------
+        results: dictionary
+            For each state, a dictionary with the calibrated number of periods
+            ('steps'), the growth factors ('alphas') and the simulated and
+            empirical volatilities ('vola_sim' and 'vola_emp').
+    """
+    if method not in ('greedy', 'joint'):
+        raise ValueError("method must be 'greedy' or 'joint'")
+    if states is None:
+        states = list_states(folder)
+    data = dict((state, load_state(folder, state)) for state in states)
+    lock = threading.Lock()
+
+    def calibrate(i, state):
+        """Calibrates one state."""
+        inputs = data[state]
+        rec_alphas, rec_volas, rec_steps = find_steps(inputs['I0'], inputs['T'], A=inputs['A'],
+                                                      R=inputs['R'], phi=phi, tau=tau,
+                                                      vola_emp=inputs['vola_emp'],
+                                                      parallel_processes=parallel_processes,
+                                                      sample_size=sample_size, dev_lim=dev_lim,
+                                                      steps=steps, search=search,
+                                                      seed=None if seed is None else child_seed(seed, i),
+                                                      backend=pool, method=method)
+        best = np.argmin(np.abs(np.array(rec_volas)-inputs['vola_emp']))
+        with lock:
+            print('Calibrated', state, 'with', rec_steps[best], 'periods')
+        return dict(steps=rec_steps[best], alphas=rec_alphas[best], vola_sim=rec_volas[best],
+                    vola_emp=inputs['vola_emp'])
+
+    # one driver thread per state, all of them sharing the same pool
+    with get_executor(backend, parallel_processes) as pool:
+        with ThreadPoolExecutor(max(1, len(states))) as drivers:
+            futures = [drivers.submit(calibrate, i, state) for i, state in enumerate(states)]
+            results = dict((state, future.result()) for state, future in zip(states, futures))
+
+    if output is not None:
+        if not os.path.exists(os.path.join(output, 'alphas')):
+            os.makedirs(os.path.join(output, 'alphas'))
+        for state in states:
+            np.savetxt(os.path.join(output, 'alphas', state+'.csv'), results[state]['alphas'], fmt='%f')
+        summary = pd.DataFrame([[state, results[state]['steps'], results[state]['vola_sim'],
+                                 results[state]['vola_emp']] for state in states],
+                               columns=['state', 'steps', 'vola_sim', 'vola_emp'])
+        summary.to_csv(os.path.join(output, 'steps.csv'), index=False)
+
+    return results
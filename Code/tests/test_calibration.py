@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""Regression tests of the calibration functions of calibration.py.
+
+Usage
+-----
+    python -m pytest Code/tests
+
+"""
+
+from __future__ import division, print_function
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from calibration import estimate, find_steps
+from equivalence import national_inputs
+
+
+
+def test_joint_estimate_without_nodes_to_search():
+    """When every indicator already converges within 'dev_lim', the joint method
+    has no growth factor to search and returns the initial ones."""
+    inputs = national_inputs()
+    alphas = inputs.pop('alpha')
+    est_alphas, est_vola = estimate(steps=20, sample_size=10, alphas=alphas, dev_lim=1000,
+                                    method='joint', seed=0, **inputs)
+    assert np.array_equal(est_alphas, alphas)
+    assert est_vola > 0
+
+    rec_alphas, rec_volas, rec_steps = find_steps(vola_emp=np.inf, alphas=alphas, sample_size=10,
+                                                  dev_lim=1000, steps=20, seed=0, method='joint',
+                                                  **inputs)
+    assert rec_steps == [20]
+    assert np.array_equal(rec_alphas[0], alphas)
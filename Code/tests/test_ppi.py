@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""Regression tests of the engines of ppi.py.
+
+Usage
+-----
+    python -m pytest Code/tests
+
+"""
+
+from __future__ import division, print_function
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from ppi import run_ppi, run_ppi_batch, PPIModel
+from equivalence import national_inputs, check_engine
+
+
+
+def test_batch_without_spotted_inefficiencies():
+    """With phi=0 and H0=1, no inefficiency is ever spotted, so every historical
+    inefficiency equals 1 and run_ppi normalizes them to zeros. The batched
+    engine must do the same instead of dividing 0 by 0."""
+    inputs = national_inputs()
+    n = int(np.sum(inputs['R']))
+    inputs.update(phi=0, H0=np.ones(n))
+
+    # with a horizon, a NaN in the allocations cannot make the simulation loop forever
+    tsI, ticks, H = run_ppi_batch(n_replicas=20, seed=0, horizon=200, outputs='indicators', **inputs)
+    assert not any(np.isnan(series).any() for series in tsI)
+    assert not np.isnan(ticks).any()
+    assert np.all(H == 1)
+    assert not np.isnan(run_ppi(seed=0, horizon=200, outputs='ticks', **inputs)).any()
+
+    passed, tests = check_engine('batch', inputs, n_sims=100, seed=0)
+    assert passed, tests[tests['rejected']]
+
+
+@pytest.mark.parametrize('horizon', [0, -3, 2.5, 10., True, '10'])
+def test_invalid_horizon(horizon):
+    """A horizon that is not None or a positive integer is rejected by every
+    engine, including when a saved state is resumed, and so is a horizon that
+    a resumed state has already passed."""
+    inputs = national_inputs()
+    with pytest.raises(ValueError):
+        run_ppi(horizon=horizon, **inputs)
+    model = PPIModel(**inputs)
+    with pytest.raises(ValueError):
+        model.init_state(2, horizon=horizon)
+    with pytest.raises(ValueError):
+        model.run_many(state=model.init_state(2, seed=0), horizon=horizon)
+    assert model.init_state(2, horizon=np.int64(10)).horizon == 10
+    
+    # a horizon earlier than the periods already simulated by a resumed state
+    state = model.init_state(2, seed=0)
+    for step in range(10):
+        model.step(state)
+    with pytest.raises(ValueError):
+        model.run_many(state=state, horizon=5, outputs='indicators')
+
+
+def test_horizon_of_resumed_state():
+    """A resumed state whose horizon equals the periods that it has already
+    simulated gives empty time series."""
+    model = PPIModel(**national_inputs())
+    state = model.init_state(2, seed=0)
+    for step in range(10):
+        model.step(state)
+    tsI, ticks, H = model.run_many(state=state.fork(), horizon=10, outputs='indicators')
+    assert [series.shape for series in tsI] == [(model.N, 0)]*2
+    tsI, ticks, H = model.run_many(state=state.fork(), horizon=12, outputs='indicators')
+    assert [series.shape for series in tsI] == [(model.N, 2)]*2